@@ -0,0 +1,453 @@
+#!/usr/bin/env python
+"""
+Local stand-in for Chase Mobile Banking that serves synthetic pages shaped like
+the real ones, or pages recorded from the real site, so the library can be
+exercised without touching the bank. It implements logging in, the accounts
+list, paginated account activity, transfers between debit accounts and credit
+card payments.
+
+Usage: python benchmarks/mockchase.py [-p PORT] [-r RECORDINGS] [--pages N]
+           [--latency SECONDS] [--session-timeout SECONDS] [--tls CERT KEY]
+"""
+from __future__ import print_function
+
+import BaseHTTPServer
+import Cookie
+import SocketServer
+import argparse
+import os
+import socket
+import ssl
+import sys
+import threading
+import time
+import urllib
+import urlparse
+
+SESSION_COOKIE = 'mocksession'
+
+# Rows of transactions per activity page.
+ROWS_PER_PAGE = 25
+
+LOGIN_PAGE = """<html><body>
+<form id="auth_form" action="/Public/Home/LogOn" method="post">
+<input type="text" name="auth_userId"/>
+<input type="password" name="auth_passwd"/>
+<input type="submit" name="LogOn" value="Log On"/>
+</form></body></html>"""
+
+DEBIT_ACCOUNT = """
+<tr><td id="%(id)s"><a href="/Secure/Accounts/Activity?id=%(id)s">%(name)s</a>
+</td></tr>
+<tr><td>Present balance</td><td>$%(balance)s</td></tr>
+<tr><td>Available balance</td><td>$%(balance)s</td></tr>
+<tr><td><a href="/Secure/Transfer/From?fromId=%(id)s">Transfer Money</a>
+</td></tr>
+<tr><td><hr/></td></tr>"""
+
+CREDIT_ACCOUNT = """
+<tr><td id="%(id)s"><a href="/Secure/Accounts/Activity?id=%(id)s">%(name)s</a>
+</td></tr>
+<tr><td>Current balance</td><td>$%(balance)s</td></tr>
+<tr><td>Available credit</td><td>$%(credit)s</td></tr>
+<tr><td>Next payment due</td><td>05/20/2014</td></tr>
+<tr><td><a href="/Secure/Pay/Start?id=%(id)s">Pay Credit Card</a></td></tr>
+<tr><td><hr/></td></tr>"""
+
+DEBIT_TRANSACTION = """<tr><td>%(name)s</td></tr>
+<tr><td>Date</td><td>%(date)s</td></tr>
+<tr><td>Debit / Credit</td><td>-$%(amount)s</td></tr>
+<tr><td>Balance</td><td>$%(balance)s</td></tr>
+<tr><td><hr/></td></tr>"""
+
+CREDIT_TRANSACTION = """<tr><td>%(name)s</td></tr>
+<tr><td>Transaction Date</td><td>%(date)s</td></tr>
+<tr><td>Type</td><td>Sale</td></tr>
+<tr><td>Transaction Number</td><td>%(number)s</td></tr>
+<tr><td>Debit / Credit Amount</td><td>$%(amount)s</td></tr>
+<tr><td>Memo / Description</td><td></td></tr>
+<tr><td><hr/></td></tr>"""
+
+TRANSFER_DETAILS_PAGE = """<html><body>
+<form action="/Secure/Transfer/Transfer/EnterDetails" method="post">
+<input type="hidden" name="FromId" value="%(from)s"/>
+<input type="hidden" name="ToId" value="%(to)s"/>
+<input type="text" name="DeliverByDate" value=""/>
+<input type="text" name="Memo" value=""/>
+<input type="text" name="Amount" value=""/>
+<input type="submit" name="Next" value="Next"/>
+</form></body></html>"""
+
+TRANSFER_VERIFY_PAGE = """<html><body><p>Step 4 of 5</p>
+<form action="/Secure/Transfer/Transfer/Complete" method="post">
+<input type="submit" name="Submit" value="Submit"/>
+</form></body></html>"""
+
+PAYMENT_OPTIONS_PAGE = """<html><body>
+<form action="/Secure/Pay/Amount" method="post"><table>
+<tr><td><input type="radio" id="PaymentOptionId" name="PaymentOptionId"
+value="1"/></td><td>Statement balance $%(balance)s</td></tr>
+<tr><td><input type="radio" id="PaymentOptionId" name="PaymentOptionId"
+value="2"/></td><td>Current Balance $%(balance)s</td></tr>
+<tr><td><input type="radio" id="PaymentOptionId" name="PaymentOptionId"
+value="3"/></td><td>Minimum payment $25.00</td></tr>
+<tr><td><input type="radio" id="PaymentOptionId" name="PaymentOptionId"
+value="4"/></td><td>Other amount <input type="text" name="Amount"/></td></tr>
+</table><input type="submit" name="Submit" value="Submit"/>
+</form></body></html>"""
+
+PAYMENT_STEP_PAGE = """<html><body><p>Step 3 of 4</p>
+<table><tr><td>Total payment amount: $%(amount)s</td></tr></table>
+<form action="%(action)s" method="post">
+<input type="submit" name="Submit" value="Submit"/>
+</form></body></html>"""
+
+REFRESH_META = ('<head><meta http-equiv="refresh" '
+    'content="%d;url=/Public/Home/LogOff"/>')
+ERROR_PAGE = """<html><body><div class="coaching">%s</div></body></html>"""
+
+
+def page(body):
+    return '<html><head></head><body>%s</body></html>' % body
+
+
+class MockChase(object):
+    """
+    State of the mock bank: its accounts, how many pages of activity each
+    one has and the active sessions. The number of requests served for each
+    path is counted in `requests`, and every response is delayed by `latency`
+    seconds to simulate the network. When `session_timeout` is set, sessions
+    expire after being idle for that many seconds, and pages carry the same
+    refresh hint the real site uses to log out idle users.
+    """
+    def __init__(self, debit_accounts=2, credit_accounts=1, pages=100,
+      latency=0, recordings=None, session_timeout=None):
+        self.pages = pages
+        self.latency = latency
+        self.recordings = recordings
+        self.session_timeout = session_timeout
+        # Time each session was last used keyed by session ID.
+        self.sessions = dict()
+        self.requests = dict()
+        self.lock = threading.Lock()
+
+        self.accounts = list()
+        for index in range(debit_accounts + credit_accounts):
+            credit = index >= debit_accounts
+            self.accounts.append({
+                'id': str(1000 + index),
+                'name': '%s (...%04d)' % (
+                    'CREDIT CARD' if credit else 'TOTAL CHECKING', index),
+                'balance': '1,%03d.00' % index,
+                'credit': '5,000.00',
+                'kind': 'credit' if credit else 'debit',
+            })
+
+    def account(self, id_):
+        for account in self.accounts:
+            if account['id'] == id_:
+                return account
+        return None
+
+    def reset(self):
+        """
+        Forget every session and request count.
+        """
+        with self.lock:
+            self.sessions.clear()
+            self.requests.clear()
+
+    def request_count(self, prefix=''):
+        """
+        Return the number of requests served for paths starting with
+        `prefix`.
+        """
+        with self.lock:
+            return sum(count for path, count in self.requests.items()
+                if path.startswith(prefix))
+
+    def accounts_page(self):
+        rows = list()
+        for account in self.accounts:
+            if account['kind'] == 'credit':
+                rows.append(CREDIT_ACCOUNT % account)
+            else:
+                rows.append(DEBIT_ACCOUNT % account)
+        rows.append('<tr><td>Footer</td></tr>')
+        return page('<table>%s</table>' % ''.join(rows))
+
+    def activity_page(self, account, number):
+        rows = list()
+        credit = account['kind'] == 'credit'
+        for index in range(ROWS_PER_PAGE):
+            n = number * ROWS_PER_PAGE + index
+            # Dates go back one day every other transaction.
+            days = n // 2
+            year = 2014 - days // 336
+            month = 12 - days // 28 % 12
+            day = 28 - days % 28
+            values = {
+                'name': 'MERCHANT #%d' % (n % 97),
+                'date': '%02d/%02d/%d' % (month, day, year),
+                'amount': '%d.%02d' % (n % 300, n % 100),
+                'balance': '%d.00' % (10000 + n),
+                'number': '%08d' % n,
+            }
+            template = CREDIT_TRANSACTION if credit else DEBIT_TRANSACTION
+            rows.append(template % values)
+
+        link = ''
+        if number + 1 < self.pages:
+            link = '<a href="/Secure/Accounts/Activity?id=%s&amp;page=%d">' \
+                'Next</a>' % (account['id'], number + 1)
+
+        # Like the real site, activity pages start with an empty table.
+        return page('<table></table><table>%s</table>%s' % (''.join(rows),
+            link))
+
+    def respond(self, method, path, query, form, session):
+        """
+        Return the status, headers and body of the response to a request.
+        """
+        if self.recordings:
+            recorded = os.path.join(self.recordings, urllib.quote(
+                path + ('?' + query if query else ''), safe='') + '.html')
+            if os.path.exists(recorded):
+                with open(recorded) as iostream:
+                    return 200, [], iostream.read()
+
+        parameters = dict(urlparse.parse_qsl(query))
+        parameters.update(form)
+
+        if path == '/Public/Home/LogOn':
+            if method == 'GET':
+                return 200, [], LOGIN_PAGE
+            if not form.get('auth_userId') or not form.get('auth_passwd'):
+                return 200, [], ERROR_PAGE % 'Invalid user ID or password.'
+            session = os.urandom(8).encode('hex')
+            with self.lock:
+                self.sessions[session] = time.time()
+            cookie = '%s=%s; Path=/' % (SESSION_COOKIE, session)
+            return 302, [('Set-Cookie', cookie),
+                ('Location', '/Secure/Accounts/')], ''
+
+        with self.lock:
+            last_used = self.sessions.get(session)
+            if last_used is None or (self.session_timeout and
+              time.time() - last_used > self.session_timeout):
+                self.sessions.pop(session, None)
+                return 200, [], LOGIN_PAGE
+            self.sessions[session] = time.time()
+
+        if path == '/Secure/Accounts/':
+            return 200, [], self.accounts_page()
+
+        account = self.account(parameters.get('id') or
+            parameters.get('fromId'))
+
+        if path == '/Secure/Accounts/Activity' and account:
+            number = int(parameters.get('page', 0))
+            return 200, [], self.activity_page(account, number)
+
+        if path == '/Secure/Transfer/From' and account:
+            links = ['<a href="/Secure/Transfer/Transfer/EnterDetails'
+                '?fromId=%s&toId=%s">%s</a>' % (account['id'], other['id'],
+                other['name']) for other in self.accounts
+                if other is not account and other['kind'] == 'debit']
+            return 200, [], page('<br/>'.join(links))
+
+        if path == '/Secure/Transfer/Transfer/EnterDetails':
+            if method == 'GET':
+                return 200, [], TRANSFER_DETAILS_PAGE % {
+                    'from': parameters.get('fromId'),
+                    'to': parameters.get('toId')}
+            try:
+                amount = float(form.get('Amount'))
+            except (TypeError, ValueError):
+                return 200, [], ERROR_PAGE % 'Please enter a valid amount.'
+            if amount <= 0:
+                return 200, [], ERROR_PAGE % 'Please enter a valid amount.'
+            return 302, [('Location', '/Secure/Transfer/Transfer/Verify')], ''
+
+        if path == '/Secure/Transfer/Transfer/Verify':
+            return 200, [], TRANSFER_VERIFY_PAGE
+
+        if path == '/Secure/Transfer/Transfer/Complete':
+            return 200, [], page('<p>Step 5 of 5</p><p>Transferred.</p>')
+
+        if path == '/Secure/Pay/Start' and account:
+            links = ['<a href="/Secure/Pay/Options?id=%s&fromId=%s">%s</a>' % (
+                account['id'], other['id'], other['name'])
+                for other in self.accounts if other['kind'] == 'debit']
+            return 200, [], page('<br/>'.join(links))
+
+        if path == '/Secure/Pay/Options' and account:
+            return 200, [], PAYMENT_OPTIONS_PAGE % account
+
+        if path == '/Secure/Pay/Amount':
+            amount = form.get('Amount') or '25.00'
+            return 200, [], PAYMENT_STEP_PAGE % {'amount': amount,
+                'action': '/Secure/Pay/Confirm?amount=%s' % amount}
+
+        if path == '/Secure/Pay/Confirm':
+            if 'confirmed' not in parameters:
+                return 200, [], PAYMENT_STEP_PAGE % {
+                    'amount': parameters.get('amount'),
+                    'action': '/Secure/Pay/Confirm?confirmed=1'}
+            return 200, [], page('<p>Step 4 of 4</p><p>Payment scheduled.</p>')
+
+        return 404, [], page('Not found')
+
+
+class Handler(BaseHTTPServer.BaseHTTPRequestHandler):
+    protocol_version = 'HTTP/1.1'
+    # Responses are sent with a single write like a real web server would.
+    # Unbuffered, each header is sent separately which lets delayed
+    # acknowledgements stall every response on keep-alive connections.
+    wbufsize = -1
+
+    def log_message(self, *args):
+        pass
+
+    def handle_request(self, method):
+        bank = self.server.bank
+        parsed = urlparse.urlsplit(self.path)
+        with bank.lock:
+            bank.requests[parsed.path] = bank.requests.get(parsed.path, 0) + 1
+
+        form = dict()
+        if method == 'POST':
+            length = int(self.headers.get('Content-Length') or 0)
+            form = dict(urlparse.parse_qsl(self.rfile.read(length)))
+
+        cookies = Cookie.SimpleCookie(self.headers.get('Cookie', ''))
+        session = cookies[SESSION_COOKIE].value if (
+            SESSION_COOKIE in cookies) else None
+
+        status, headers, body = bank.respond(method, parsed.path, parsed.query,
+            form, session)
+        if bank.session_timeout and session in bank.sessions:
+            body = body.replace('<head>', REFRESH_META % bank.session_timeout,
+                1)
+        if bank.latency:
+            time.sleep(bank.latency)
+
+        self.send_response(status)
+        self.send_header('Content-Type', 'text/html; charset=utf-8')
+        self.send_header('Content-Length', str(len(body)))
+        for header, value in headers:
+            self.send_header(header, value)
+        self.end_headers()
+        self.wfile.write(body)
+
+    def do_GET(self):
+        self.handle_request('GET')
+
+    def do_POST(self):
+        self.handle_request('POST')
+
+
+class Server(SocketServer.ThreadingMixIn, BaseHTTPServer.HTTPServer):
+    daemon_threads = True
+    allow_reuse_address = True
+
+    def __init__(self, bank, port=0, certfile=None, keyfile=None):
+        BaseHTTPServer.HTTPServer.__init__(self, ('127.0.0.1', port), Handler)
+        self.bank = bank
+        self.certfile = certfile
+        self.keyfile = keyfile
+        self.connections = set()
+        self.connections_lock = threading.Lock()
+
+    def close(self):
+        """
+        Stop serving and disconnect every client.
+        """
+        self.shutdown()
+        self.server_close()
+        with self.connections_lock:
+            connections = list(self.connections)
+        for connection in connections:
+            try:
+                connection.shutdown(socket.SHUT_RDWR)
+            except socket.error:
+                pass
+
+    def shutdown_request(self, request):
+        with self.connections_lock:
+            self.connections.discard(request)
+        BaseHTTPServer.HTTPServer.shutdown_request(self, request)
+
+    def handle_error(self, request, client_address):
+        # Clients are free to drop idle keep-alive connections.
+        if not issubclass(sys.exc_info()[0], (socket.error, ssl.SSLError)):
+            BaseHTTPServer.HTTPServer.handle_error(self, request,
+                client_address)
+
+    def get_request(self):
+        connection, address = self.socket.accept()
+        if self.certfile:
+            connection = ssl.wrap_socket(connection, server_side=True,
+                certfile=self.certfile, keyfile=self.keyfile)
+        with self.connections_lock:
+            self.connections.add(connection)
+        return connection, address
+
+    @property
+    def url(self):
+        if self.certfile:
+            return 'https://localhost:%d' % self.server_address[1]
+        return 'http://127.0.0.1:%d' % self.server_address[1]
+
+
+def serve(bank, port=0, certfile=None, keyfile=None):
+    """
+    Start a server for `bank` in a background thread and return it. Its base
+    URL is available as `url`.
+    """
+    server = Server(bank, port, certfile, keyfile)
+    thread = threading.Thread(target=server.serve_forever)
+    thread.daemon = True
+    thread.start()
+    return server
+
+
+def agent_class(base_url):
+    """
+    Return a ChaseOnlineBankingAgent subclass that uses the server at
+    `base_url` instead of Chase Mobile Banking.
+    """
+    import coba
+
+    class MockChaseAgent(coba.ChaseOnlineBankingAgent):
+        chasemobileloginurl = base_url + '/Public/Home/LogOn'
+        accountslisturl = base_url + '/Secure/Accounts/'
+
+    return MockChaseAgent
+
+
+def main():
+    parser = argparse.ArgumentParser(description=__doc__.split('\n\n')[0])
+    parser.add_argument('-p', '--port', type=int, default=8443)
+    parser.add_argument('-r', '--recordings', help='directory of recorded '
+        'pages named after their URL-quoted path and query string')
+    parser.add_argument('--pages', type=int, default=100,
+        help='pages of activity per account')
+    parser.add_argument('--latency', type=float, default=0,
+        help='seconds to wait before each response')
+    parser.add_argument('--session-timeout', type=int, help='seconds after '
+        'which idle sessions expire')
+    parser.add_argument('--tls', nargs=2, metavar=('CERT', 'KEY'))
+    arguments = parser.parse_args()
+
+    certfile, keyfile = arguments.tls or (None, None)
+    bank = MockChase(pages=arguments.pages, latency=arguments.latency,
+        recordings=arguments.recordings,
+        session_timeout=arguments.session_timeout)
+    server = Server(bank, arguments.port, certfile, keyfile)
+    print('Serving on %s' % server.url)
+    server.serve_forever()
+
+
+if __name__ == '__main__':
+    main()
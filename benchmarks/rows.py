@@ -0,0 +1,90 @@
+#!/usr/bin/env python
+"""
+Micro-benchmark of the conversion of transaction table cells into values,
+comparing coba.rows with the inline conversions it replaced. Pages are parsed
+once up front so only the per-row work is measured.
+
+Usage: python benchmarks/rows.py [ROWS]
+"""
+from __future__ import print_function
+
+import datetime
+import decimal
+import os
+import re
+import sys
+import timeit
+
+sys.path.insert(0, os.path.join(os.path.dirname(__file__), '..', 'src'))
+
+import bs4
+
+import coba
+from coba import rows
+
+ROW_KEY_MAP = {
+    'balance': 'balance',
+    'transaction_date': 'date',
+    'date': 'date',
+    'type': 'type',
+    'memo_description': 'memo',
+    'transaction_number': 'id',
+    'debit_credit_amount': 'amount',
+    'debit_credit': 'amount',
+}
+
+
+def synthetic_cells(count):
+    """
+    Return pairs of label and value cells like those of `count` transactions
+    on a credit card activity page.
+    """
+    html = list()
+    for n in range(count):
+        html.append('<tr><td>Transaction Date</td><td>%02d/%02d/2014</td></tr>'
+            % (n % 12 + 1, n % 28 + 1))
+        html.append('<tr><td>Type</td><td>Sale</td></tr>')
+        html.append('<tr><td>Debit / Credit Amount</td><td>$%d,%03d.%02d</td>'
+            '</tr>' % (n % 10, n % 1000, n % 100))
+        html.append('<tr><td>Memo / Description</td><td></td></tr>')
+
+    soup = bs4.BeautifulSoup('<table>%s</table>' % ''.join(html),
+        coba.HTML_PARSER)
+    return [row.find_all('td') for row in soup.find_all('tr')]
+
+
+def legacy(cells):
+    for left_column, right_column in cells:
+        key = re.sub('\\b_|_\\b', '', re.sub('[^a-z0-9_-]+', '_',
+            ' '.join(left_column.contents).lower()))
+        constructor_key = ROW_KEY_MAP.get(key)
+        value = ' '.join(right_column.contents).strip()
+        if value.startswith(('$', '-$')):
+            value = decimal.Decimal(re.sub('[^0-9.-]+', '', value))
+        elif constructor_key == 'date':
+            m, d, y = map(int, value.split('/'))
+            value = datetime.datetime(y, m, d)
+
+
+def decoder(cells):
+    for left_column, right_column in cells:
+        key = rows.label_key(rows.cell_text(left_column))
+        constructor_key = ROW_KEY_MAP.get(key)
+        value = rows.cell_text(right_column)
+        if value.startswith(('$', '-$')):
+            value = rows.parse_amount(value)
+        elif constructor_key == 'date':
+            value = rows.parse_date(value)
+
+
+def main():
+    count = int(sys.argv[1]) if len(sys.argv) > 1 else 2000
+    cells = synthetic_cells(count)
+    for name, function in (('inline', legacy), ('coba.rows', decoder)):
+        seconds = min(timeit.repeat(lambda: function(cells), number=1,
+            repeat=5))
+        print('%-10s %10.0f rows/s' % (name, len(cells) / seconds))
+
+
+if __name__ == '__main__':
+    main()
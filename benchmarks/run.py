@@ -0,0 +1,198 @@
+#!/usr/bin/env python
+"""
+Offline benchmarks of the library against the mock Chase server in
+benchmarks/mockchase.py. Each scenario is run several times and its latency
+percentiles, pages fetched per second, time spent parsing pages and growth of
+the peak resident set size are reported.
+
+The results can be saved as JSON with --save and compared with previously
+saved results with --baseline, in which case the exit status is non-zero if
+the median latency of any scenario got worse by more than --tolerance, so the
+benchmarks can be run in continuous integration.
+
+Usage: python benchmarks/run.py [-n ITERATIONS] [--save FILE]
+           [--baseline FILE] [--tolerance FRACTION] [--latency SECONDS]
+           [--tls CERT KEY]
+"""
+from __future__ import print_function
+
+import argparse
+import json
+import os
+import resource
+import sys
+import time
+
+sys.path.insert(0, os.path.join(os.path.dirname(__file__), '..', 'src'))
+
+import mockchase
+
+PAGE_COUNTS = (1, 10, 100)
+
+
+def peak_rss():
+    """
+    Return the peak resident set size of the process in kilobytes.
+    """
+    peak = resource.getrusage(resource.RUSAGE_SELF).ru_maxrss
+    # Linux reports kilobytes while OS X reports bytes.
+    if sys.platform == 'darwin':
+        peak //= 1024
+    return peak
+
+
+def percentile(samples, fraction):
+    """
+    Return the value below which `fraction` of the samples fall using the
+    nearest-rank method.
+    """
+    ordered = sorted(samples)
+    rank = int(round(fraction * len(ordered))) - 1
+    return ordered[max(0, min(len(ordered) - 1, rank))]
+
+
+def scenarios(agent):
+    """
+    Return pairs of names and functions for every benchmark. The functions
+    are called with no arguments.
+    """
+    def accounts():
+        agent.refresh_accounts()
+
+    account_list = agent.accounts
+    debit = [account for account in account_list
+        if type(account).__name__ == 'ChaseDebitAccount']
+    credit = [account for account in account_list
+        if type(account).__name__ == 'ChaseCreditAccount']
+
+    result = [('accounts', accounts)]
+    for pages in PAGE_COUNTS:
+        def transactions(pages=pages):
+            for _ in debit[0].transactions(maxpages=pages):
+                pass
+        result.append(('transactions/%d' % pages, transactions))
+
+    result.append(('transfer_to', lambda: debit[0].transfer_to(debit[1], 10)))
+    result.append(('pay_from', lambda: credit[0].pay_from(debit[0], 25)))
+    return result
+
+
+def run(iterations, latency=0, certfile=None, keyfile=None):
+    """
+    Run every scenario `iterations` times against a new mock server and
+    return a dictionary of results keyed by scenario name.
+    """
+    from coba import instrument
+
+    bank = mockchase.MockChase(pages=max(PAGE_COUNTS), latency=latency)
+    server = mockchase.serve(bank, certfile=certfile, keyfile=keyfile)
+    stats = instrument.Stats()
+    agent = mockchase.agent_class(server.url)('user', 'password',
+        accounts_ttl=0, instrumentation=stats)
+
+    results = dict()
+    for name, function in scenarios(agent):
+        # One unmeasured run warms up connections and caches.
+        function()
+
+        samples = list()
+        bank.reset()
+        agent.login()
+        requests = bank.request_count()
+        stats.reset()
+        rss = peak_rss()
+        for _ in range(iterations):
+            start = time.time()
+            function()
+            samples.append(time.time() - start)
+
+        pages = bank.request_count() - requests
+        total = sum(samples)
+        parse = stats.histograms.get('parse')
+        results[name] = {
+            'p50': percentile(samples, 0.50),
+            'p90': percentile(samples, 0.90),
+            'p99': percentile(samples, 0.99),
+            'pages_per_second': pages / total if total else 0.0,
+            'parse_seconds': (parse.total if parse else 0.0) / iterations,
+            'peak_rss_growth_kb': peak_rss() - rss,
+        }
+
+    server.close()
+    return results
+
+
+def report(results, baseline=None):
+    """
+    Print a table of results, with the change in median latency relative to
+    the baseline when one is given.
+    """
+    header = '%-18s %9s %9s %9s %10s %9s %9s' % ('scenario', 'p50 ms',
+        'p90 ms', 'p99 ms', 'pages/s', 'parse ms', 'rss +kB')
+    if baseline:
+        header += ' %8s' % 'vs base'
+    print(header)
+
+    for name in sorted(results):
+        result = results[name]
+        line = '%-18s %9.2f %9.2f %9.2f %10.1f %9.2f %9d' % (name,
+            result['p50'] * 1000, result['p90'] * 1000, result['p99'] * 1000,
+            result['pages_per_second'], result['parse_seconds'] * 1000,
+            result['peak_rss_growth_kb'])
+        if baseline and name in baseline:
+            line += ' %+7.1f%%' % (
+                (result['p50'] / baseline[name]['p50'] - 1) * 100)
+        print(line)
+
+
+def regressions(results, baseline, tolerance):
+    """
+    Return the names of scenarios whose median latency exceeds the baseline
+    by more than `tolerance`, a fraction of the baseline.
+    """
+    return [name for name in sorted(results) if name in baseline and
+        results[name]['p50'] > baseline[name]['p50'] * (1 + tolerance)]
+
+
+def main():
+    parser = argparse.ArgumentParser(description=__doc__.split('\n\n')[0])
+    parser.add_argument('-n', '--iterations', type=int, default=20)
+    parser.add_argument('--latency', type=float, default=0,
+        help='simulated network latency in seconds')
+    parser.add_argument('--save', help='write the results to this JSON file')
+    parser.add_argument('--baseline', help='compare with results saved '
+        'from an earlier run')
+    parser.add_argument('--tolerance', type=float, default=0.25,
+        help='allowed slowdown relative to the baseline (default: 0.25)')
+    parser.add_argument('--tls', nargs=2, metavar=('CERT', 'KEY'),
+        help='serve over HTTPS with this self-signed certificate and key')
+    arguments = parser.parse_args()
+
+    certfile, keyfile = arguments.tls or (None, None)
+    if certfile:
+        # Must be set before coba is imported for the certificate to be
+        # trusted.
+        os.environ['CA_CERTS'] = certfile
+
+    results = run(arguments.iterations, arguments.latency, certfile, keyfile)
+
+    baseline = None
+    if arguments.baseline:
+        with open(arguments.baseline) as iostream:
+            baseline = json.load(iostream)
+
+    report(results, baseline)
+
+    if arguments.save:
+        with open(arguments.save, 'w') as iostream:
+            json.dump(results, iostream, indent=2, sort_keys=True)
+
+    if baseline:
+        slower = regressions(results, baseline, arguments.tolerance)
+        if slower:
+            print('Slower than the baseline: %s' % ', '.join(slower))
+            sys.exit(1)
+
+
+if __name__ == '__main__':
+    main()
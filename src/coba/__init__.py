@@ -2,17 +2,35 @@
 __author__ = "Eric Pruitt <eric.pruitt@gmail.com>"
 __license__ = "2-Clause BSD"
 
+import atexit
 import collections
 import cookielib
+import copy
 import datetime
 import decimal
 import errno
+import functools
+import heapq
+import multiprocessing.pool
+import os
+import Queue
 import re
+import tempfile
+import threading
+import time
+import urlparse
+import weakref
 
 import bs4
 import mechanize
 import zope.testbrowser.browser
 
+import archive
+import batch
+import export
+import instrument
+import rows
+import scheduler
 # Not actually used here, but the module must be imported to initiate
 # monkey-patching.
 import urllib2_ssl
@@ -25,6 +43,7 @@ except ImportError:
 __all__ = ["ChaseOnlineBankingError", "ChaseOnlineBankingAgent",
     "ChaseBankAccount", "ChaseCreditAccount", "ChaseDebitAccount", "wordize",
     "DebitAccountTransaction", "CreditAccountTransaction", "CALL_VERIFICATION",
+    "concurrent_transactions", "merged_transactions", "PersistentCookieJar",
     "EMAIL_VERIFICATION", "TEXT_MESSAGE_VERIFICATION", "PAY_STATEMENT_BALANCE",
     "PAY_CURRENT_BALANCE", "PAY_MINIMUM_BALANCE"]
 
@@ -40,6 +59,25 @@ DebitAccountTransaction = collections.namedtuple('DebitAccountTransaction',
 CreditAccountTransaction = collections.namedtuple('CreditAccountTransaction',
     'name date type id amount memo')
 
+# Tree builder used to parse pages. lxml is the fastest of the parsers that
+# Beautiful Soup supports, and html5lib is still preferable to the pure-Python
+# HTMLParser wrapper when lxml is not installed.
+for HTML_PARSER in ('lxml', 'html5lib', 'html.parser'):
+    if bs4.builder.builder_registry.lookup(HTML_PARSER):
+        break
+
+# Idle sessions are refreshed once this fraction of the lifetime given by the
+# server's refresh hint has passed since the last request.
+SESSION_REFRESH_FRACTION = 0.8
+
+# Strainers used to restrict parsing to the parts of a page that a scraper
+# actually inspects.
+_AUTH_FORM_ONLY = bs4.SoupStrainer(id='auth_form')
+_COACHING_ONLY = bs4.SoupStrainer(class_='coaching')
+_LINKS_ONLY = bs4.SoupStrainer('a')
+_TABLES_ONLY = bs4.SoupStrainer('table')
+_TABLES_AND_LINKS_ONLY = bs4.SoupStrainer(['table', 'a'])
+
 
 class ChaseOnlineBankingError(Exception):
     """
@@ -47,46 +85,250 @@ class ChaseOnlineBankingError(Exception):
     """
 
 
+class PersistentCookieJar(cookielib.LWPCookieJar):
+    """
+    LWPCookieJar that keeps track of whether its cookies have changed since
+    they were last loaded or saved and saves them atomically so other
+    processes never read a partially written file.
+    """
+    dirty = False
+
+    def set_cookie(self, cookie):
+        # Servers tend to send the same cookies with every response, so only
+        # a new value or expiration time counts as a change.
+        try:
+            existing = self._cookies[cookie.domain][cookie.path][cookie.name]
+        except KeyError:
+            existing = None
+
+        if (existing is None or existing.value != cookie.value or
+          existing.expires != cookie.expires):
+            self.dirty = True
+
+        cookielib.LWPCookieJar.set_cookie(self, cookie)
+
+    def clear(self, *args, **kwargs):
+        self.dirty = True
+        cookielib.LWPCookieJar.clear(self, *args, **kwargs)
+
+    def load(self, *args, **kwargs):
+        cookielib.LWPCookieJar.load(self, *args, **kwargs)
+        self.dirty = False
+
+    def save(self, filename=None, ignore_discard=False, ignore_expires=False):
+        filename = filename or self.filename
+        if not filename:
+            raise ValueError(cookielib.MISSING_FILENAME_TEXT)
+
+        # Cookies changed while the file is being written will be saved the
+        # next time around.
+        self.dirty = False
+        directory = os.path.dirname(os.path.abspath(filename))
+        fd, temporary = tempfile.mkstemp(dir=directory, prefix='.cookies-')
+        os.close(fd)
+        try:
+            cookielib.LWPCookieJar.save(self, temporary, ignore_discard,
+                ignore_expires)
+            if os.name == 'nt' and os.path.exists(filename):
+                # Windows will not rename a file over an existing one.
+                os.remove(filename)
+            os.rename(temporary, filename)
+        except Exception:
+            self.dirty = True
+            os.remove(temporary)
+            raise
+
+
+# Agents whose cookies should be saved when the interpreter exits.
+_agents = weakref.WeakSet()
+
+
+class _LoginState(object):
+    """
+    Session state shared by an agent and its forks.
+    """
+    def __init__(self):
+        # Held while logging in. Incremented after every login so threads
+        # that found the session expired can tell whether another one has
+        # logged in since.
+        self.lock = threading.RLock()
+        self.generation = 0
+        # Lifetime of idle sessions in seconds according to the server's
+        # refresh hint, when the session was last used by a request of any
+        # kind and by a caller, and the timer that will refresh it.
+        self.lifetime = None
+        self.touched = 0
+        self.used = 0
+        self.timer = None
+        self.timer_lock = threading.Lock()
+        # Set once the agent is closed so the session is no longer refreshed.
+        self.closed = False
+
+
+@atexit.register
+def _save_all_cookies():
+    for agent in list(_agents):
+        agent.save_cookies()
+
+
 class ChaseOnlineBankingAgent:
     chasemobileloginurl = 'https://mobilebanking.chase.com/Public/Home/LogOn'
     accountslisturl = 'https://mobilebanking.chase.com/Secure/Accounts/'
 
     def __init__(self, username, password, otp_type=None, cookiefile=None,
-      useragent='COBA/Python (+https://github.com/ericpruitt)'):
+      useragent='COBA/Python (+https://github.com/ericpruitt)', parser=None,
+      lazy=False, accounts_ttl=60, cookie_save_delay=5, instrumentation=None,
+      archive=None, scheduler=None, priority=scheduler.INTERACTIVE,
+      keepalive=0):
         self.username = username
         self.password = password
         self.cookiefile = cookiefile
         self.otp_type = otp_type or EMAIL_VERIFICATION
+        self.parser = parser or HTML_PARSER
+        self.useragent = useragent
+
+        # Recorder told how long navigation, parsing and error checks take, or
+        # None. Forked agents share it. See coba.instrument.
+        self.instrumentation = instrumentation
+
+        # coba.archive.HTTPArchive that records the responses the browser
+        # receives or replays them instead of using the network, or None.
+        self.archive = archive
+
+        # coba.scheduler.Scheduler that every request waits for, or None, and
+        # the priority of the agent's requests. Forked agents share both.
+        self.scheduler = scheduler
+        self.priority = priority
+
+        # Accounts are kept for `accounts_ttl` seconds. See the "accounts"
+        # property.
+        self.accounts_ttl = accounts_ttl
+        self._accounts_snapshot = None
+
+        # When `keepalive` is set, a timer thread makes background requests
+        # so the server does not log the session out for being idle, which
+        # stops once the agent has not been used for `keepalive` seconds or
+        # is closed. Until then, the timer holds a reference to the agent.
+        # See the "_track_session" method.
+        self.keepalive = keepalive
+        self._login_state = _LoginState()
+
+        # The cookie jar is thread-safe and shared with forked agents; the lock
+        # keeps them from writing the cookie file at the same time. Changed
+        # cookies are written at most `cookie_save_delay` seconds after they
+        # were received instead of after every request.
+        self.cookiejar = PersistentCookieJar()
+        self.cookie_lock = threading.Lock()
+        self.cookie_save_delay = cookie_save_delay
+        self._cookie_timer = None
+        if cookiefile:
+            self.load_cookies()
+            _agents.add(self)
+
+        self._create_browser()
 
+        # Unless the agent is lazy, make sure the session works right away so
+        # any problems logging in surface when the agent is created.
+        if not lazy:
+            self.navigate(self.accountslisturl)
+
+    def _create_browser(self):
+        """
+        Set up the browser used to interact with Chase Online.
+        """
         self.mech_browser = mech_browser = mechanize.Browser()
-        mech_browser.addheaders = [("User-agent", useragent)]
+        mech_browser.addheaders = [("User-agent", self.useragent)]
         mech_browser.set_handle_robots(False)
+        mech_browser.set_cookiejar(self.cookiejar)
 
         # There's a refresh with a 760 second delay sent by Chase's server
         # presumably to automatically log out the user, so the refresh handler
         # must be disabled.
         mech_browser.set_handle_refresh(False)
 
-        if cookiefile:
-            self.cookiejar = cookiejar = cookielib.LWPCookieJar()
+        if self.archive is not None:
+            mech_browser.add_handler(self.archive.handler())
+        if self.scheduler is not None:
+            mech_browser.add_handler(self.scheduler.handler(self))
 
-            mech_browser.set_cookiejar(cookiejar)
-            self.load_cookies()
+        # The most recently parsed response and its BeautifulSoup trees keyed
+        # by strainer. See the "parse" method.
+        self._parsed_response = None
+        self._parsed_soups = dict()
+        self.parses_avoided = 0
 
         self.browser = zope.testbrowser.browser.Browser(mech_browser=mech_browser)
-        self.navigate(self.accountslisturl)
+
+    def close(self):
+        """
+        Stop refreshing the session and save the session cookies. The session
+        is shared with forked agents, so it is no longer refreshed for them
+        either. The agent can still be used afterwards, but its session will
+        expire once it is idle.
+        """
+        state = self._login_state
+        with state.timer_lock:
+            state.closed = True
+            timer, state.timer = state.timer, None
+        if timer is not None:
+            timer.cancel()
+
+        self.save_cookies(force=True)
+
+    def fork(self):
+        """
+        Return a new agent that shares the credentials and session cookies of
+        this one but has its own browser. Browsers are not thread-safe, so each
+        thread interacting with Chase Online should use its own fork.
+        """
+        agent = copy.copy(self)
+        agent._cookie_timer = None
+        agent._create_browser()
+        return agent
 
     def navigate(self, url):
         """
         Open a URL, but if the session has expired, attempt to log in first.
+        When the agent or its forks find the session expired at the same
+        time, only one of them logs in, and the others wait for it to finish
+        before opening the URL again.
         """
-        self.browser.open(url)
-        soup = bs4.BeautifulSoup(self.browser.contents)
-        if soup.find(id='auth_form'):
-            self.login()
+        recorder = self.instrumentation
+        if recorder is not None:
+            start = time.time()
+        generation = self._login_state.generation
+
+        # Relative URLs are resolved against the accounts page when nothing
+        # has been loaded yet, e.g. in a forked agent. If there is no session
+        # to resume, there's no point in requesting a page only to be sent to
+        # the log-in form, so log in first.
+        if self.mech_browser._response is None:
+            url = urlparse.urljoin(self.accountslisturl, url)
+            if not self.has_session():
+                self._login_once(generation)
 
-        self.save_cookies()
-        return self.browser.contents
+        self.browser.open(url)
+        # Checking for the substring first means pages that are obviously not
+        # the log-in form do not need to be parsed at all.
+        html = self.browser.contents
+        if 'auth_form' in html and self.parse(_AUTH_FORM_ONLY).find(
+          id='auth_form'):
+            if recorder is not None:
+                login_start = time.time()
+            self._login_once(generation)
+            self.browser.open(url)
+            html = self.browser.contents
+            if recorder is not None:
+                recorder.observe('relogin', time.time() - login_start)
+
+        self._track_session(used=True)
+
+        self.schedule_cookie_save()
+        if self.scheduler is not None:
+            self.scheduler.success(scheduler.host_of(self.browser.url))
+        if recorder is not None:
+            recorder.observe('navigate', time.time() - start)
+        return html
 
     def login(self, otp_type=None, otp=None, otp_prompt_call=None):
         """
@@ -157,18 +399,147 @@ class ChaseOnlineBankingAgent:
 
         self.save_cookies()
         self.check_for_errors()
+        self._login_state.generation += 1
+        self._track_session(used=True)
+
+    def _login_once(self, generation):
+        """
+        Log in unless the agent or one of its forks has already done so since
+        the login counter was at `generation`. Waiting for a login that is in
+        progress instead of starting another one means the user is prompted
+        for a verification code at most once. If that login fails, the next
+        caller in line tries again.
+        """
+        with self._login_state.lock:
+            if self._login_state.generation == generation:
+                self.login()
+
+    def _track_session(self, used=False):
+        """
+        Note that a request was just made, or that the agent was used when
+        `used` is set, and make sure the session will be refreshed before the
+        server logs it out for being idle. The lifetime of idle sessions is
+        taken from the refresh hint of the current page.
+        """
+        state = self._login_state
+        response = self.mech_browser._response
+        hint = response is not None and response.info().getheader('refresh')
+        if hint:
+            try:
+                state.lifetime = float(hint.split(';', 1)[0])
+            except ValueError:
+                pass
+
+        state.touched = time.time()
+        if used:
+            state.used = state.touched
+
+        if state.lifetime and self.keepalive > 0:
+            self._schedule_refresh(state.lifetime * SESSION_REFRESH_FRACTION)
+
+    def _schedule_refresh(self, delay):
+        state = self._login_state
+        with state.timer_lock:
+            if state.timer is None and not state.closed:
+                timer = threading.Timer(delay, self._refresh_session)
+                timer.daemon = True
+                state.timer = timer
+                timer.start()
 
-    def save_cookies(self):
+    def _refresh_session(self):
         """
-        Serialize and save the session cookies.
+        Make a request so the session stays alive, unless the session was
+        used recently enough that it is not about to expire, or the agent has
+        not been used in `keepalive` seconds. The request is made with a
+        forked browser, so pages loaded by other threads are undisturbed, and
+        it never logs in since that may require prompting the user.
+        """
+        state = self._login_state
+        with state.timer_lock:
+            state.timer = None
+
+        now = time.time()
+        if state.closed or now - state.used >= self.keepalive:
+            return
+
+        due = state.touched + state.lifetime * SESSION_REFRESH_FRACTION
+        if now < due:
+            self._schedule_refresh(due - now)
+            return
+
+        agent = self.fork()
+        agent.priority = scheduler.BACKGROUND
+        recorder = self.instrumentation
+        try:
+            agent.browser.open(self.accountslisturl)
+        except Exception:
+            # Whatever went wrong will surface the next time the agent is
+            # used, when it logs in again if it has to.
+            return
+
+        if recorder is not None:
+            recorder.observe('session.refresh', time.time() - now)
+        if 'auth_form' not in agent.browser.contents:
+            agent.schedule_cookie_save()
+            agent._track_session()
+
+    def has_session(self):
+        """
+        Return True if the cookie jar holds unexpired cookies for Chase Online
+        which means there's a session that can probably be resumed. Only the
+        server can tell whether the session is actually still valid.
+        """
+        now = time.time()
+        host = urlparse.urlparse(self.accountslisturl).hostname
+        if '.' not in host:
+            # cookielib stores cookies for dotless hosts under "host.local".
+            host += '.local'
+
+        for cookie in self.cookiejar:
+            domain = cookie.domain.lstrip('.')
+            if (not cookie.is_expired(now) and
+              (host == domain or host.endswith('.' + domain))):
+                return True
+
+        return False
+
+    def schedule_cookie_save(self):
+        """
+        Save the session cookies `cookie_save_delay` seconds from now if they
+        have changed since they were last saved. Changes made in the meantime
+        are saved along with them.
+        """
+        if not self.cookiefile or not self.cookiejar.dirty:
+            return
+        elif self.cookie_save_delay <= 0:
+            self.save_cookies()
+            return
+
+        with self.cookie_lock:
+            if self._cookie_timer is None:
+                timer = threading.Timer(self.cookie_save_delay,
+                    self.save_cookies)
+                timer.daemon = True
+                self._cookie_timer = timer
+                timer.start()
+
+    def save_cookies(self, force=False):
+        """
+        Serialize and save the session cookies if they have changed since they
+        were last saved or `force` is set.
         """
         if self.cookiefile:
             # [B] Set ignore_discard so ephemeral cookies that would normally
             # not be saved by the browser between sessions are preserved
             # anyway. Ensures different instances of the program can resume a
             # previous session.
-            self.cookiejar.save(self.cookiefile, ignore_discard=True,
-                ignore_expires=False)
+            with self.cookie_lock:
+                timer, self._cookie_timer = self._cookie_timer, None
+                if timer is not None:
+                    timer.cancel()
+                if force or self.cookiejar.dirty:
+                    self.cookiejar.save(self.cookiefile, ignore_discard=True,
+                        ignore_expires=False)
 
     def load_cookies(self):
         """
@@ -187,23 +558,119 @@ class ChaseOnlineBankingAgent:
         Raise an exception if any application warnings / errors are found in
         the page contents.
         """
-        soup = bs4.BeautifulSoup(self.browser.contents)
-        coaching_tag = soup.find(class_='coaching')
+        recorder = self.instrumentation
+        if recorder is None:
+            return self._check_for_errors()
+
+        start = time.time()
+        try:
+            return self._check_for_errors()
+        finally:
+            recorder.observe('check_for_errors', time.time() - start)
+
+    def _check_for_errors(self):
+        if 'coaching' not in self.browser.contents:
+            return
+
+        coaching_tag = self.parse(_COACHING_ONLY).find(class_='coaching')
         if coaching_tag:
             if (coaching_tag.get('href') and
               coaching_tag['href'].endswith('/Announcement')):
                 return
 
+            # Error pages are how Chase Online reacts to too many requests,
+            # among other things, so requests are slowed down.
+            if self.scheduler is not None:
+                self.scheduler.failure(scheduler.host_of(self.browser.url))
+
             coaching_text = ' '.join(coaching_tag.find_all(text=True)).strip()
             raise ChaseOnlineBankingError(coaching_text)
 
+    @property
+    def soup(self):
+        """
+        BeautifulSoup instance of the entire page currently loaded in the
+        browser. Refer to the "parse" method for details about caching.
+        """
+        return self.parse()
+
+    def parse(self, parse_only=None):
+        """
+        Return a BeautifulSoup instance of the page currently loaded in the
+        browser. When `parse_only` is a bs4.SoupStrainer, only the matching
+        elements are parsed which is considerably faster and lighter on memory
+        than building the full tree. Trees are cached and keyed by the identity
+        of the underlying mechanize response and the strainer, so each page is
+        only parsed once per strainer no matter how many times it is inspected.
+        A cached tree of the entire page is reused for any strainer. The number
+        of parses skipped thanks to the cache is tracked in `parses_avoided`.
+        """
+        # mechanize.Browser.response() returns a copy of the response, so the
+        # private attribute is used to get an object whose identity only
+        # changes when a new page is loaded.
+        response = self.mech_browser._response
+        if response is None or response is not self._parsed_response:
+            self._parsed_soups = dict()
+            self._parsed_response = response
+
+        # The html5lib tree builder does not support strainers.
+        if self.parser == 'html5lib':
+            parse_only = None
+
+        recorder = self.instrumentation
+        soups = self._parsed_soups
+        for key in (None, parse_only):
+            if key in soups:
+                self.parses_avoided += 1
+                if recorder is not None:
+                    recorder.count('parse.cached')
+                return soups[key]
+
+        if recorder is not None:
+            start = time.time()
+        soups[parse_only] = soup = bs4.BeautifulSoup(self.browser.contents,
+            self.parser, parse_only=parse_only)
+        if recorder is not None:
+            recorder.observe('parse', time.time() - start)
+        return soup
+
     @property
     def accounts(self):
         """
-        Return ChaseBankAccount subclass instances representing the user's
-        debit and credit accounts.
+        Return a list of ChaseBankAccount subclass instances representing the
+        user's debit and credit accounts. The list is only fetched again once
+        it is more than `accounts_ttl` seconds old or after money has been
+        moved with ChaseDebitAccount.transfer_to or
+        ChaseCreditAccount.pay_from.
         """
-        soup = bs4.BeautifulSoup(self.navigate(self.accountslisturl))
+        snapshot = self._accounts_snapshot
+        if snapshot is None or time.time() - snapshot[0] >= self.accounts_ttl:
+            snapshot = (time.time(), list(self._scrape_accounts()))
+            self._accounts_snapshot = snapshot
+
+        return list(snapshot[1])
+
+    def refresh_accounts(self):
+        """
+        Fetch the accounts list regardless of its age and return it.
+        """
+        self.invalidate_accounts()
+        return self.accounts
+
+    def invalidate_accounts(self):
+        """
+        Discard the accounts list so it is fetched again the next time it is
+        accessed.
+        """
+        self._accounts_snapshot = None
+
+    def _scrape_accounts(self):
+        """
+        Yield ChaseBankAccount subclass instances scraped from the accounts
+        page.
+        """
+        self.navigate(self.accountslisturl)
+        soup = self.parse(_TABLES_ONLY)
         tables = soup.find_all('table')
         if len(tables) != 1:
             raise ValueError('Expected 1 table, found %d.' % len(tables))
@@ -264,17 +731,16 @@ class ChaseOnlineBankingAgent:
                 # value in the right column. Any monetary amounts will be
                 # converted to Decimal objects and dates to datetime objects.
                 left_column, right_column = columns
-                value = ' '.join(right_column.contents).strip()
-                raw_key = ' '.join(left_column.contents).strip()
+                value = rows.cell_text(right_column)
+                raw_key = rows.cell_text(left_column)
                 raw_attributes[raw_key] = value
-                key = wordize(raw_key)
+                key = rows.label_key(raw_key)
 
                 if value.startswith(('$', '-$')):
-                    value = decimal.Decimal(re.sub('[^0-9.-]+', '', value))
+                    value = rows.parse_amount(value)
                 elif '/' in value:
                     try:
-                        m, d, y = map(int, value.split('/'))
-                        value = datetime.datetime(y, m, d)
+                        value = rows.parse_date(value)
                     except ValueError:
                         # Probably not a date
                         pass
@@ -282,11 +748,32 @@ class ChaseOnlineBankingAgent:
                 attributes[key] = value
 
 
+def _invalidates_accounts(method):
+    """
+    Decorator for account methods that move money which means the balances in
+    the agent's accounts list are no longer accurate.
+    """
+    @functools.wraps(method)
+    def wrapper(self, *args, **kwargs):
+        try:
+            return method(self, *args, **kwargs)
+        finally:
+            self.agent.invalidate_accounts()
+
+    return wrapper
+
+
 class ChaseBankAccount(object):
     """
     Generic bank account class that implements functionality shared by all
     account types.
     """
+    # The attributes set by the constructor are slots. "__dict__" lets callers
+    # set attributes of their own as before; the dictionary is only created
+    # once they do.
+    __slots__ = ('agent', 'name', 'url', 'id_', 'attributes', 'raw_attributes',
+        '__dict__')
+
     def __init__(self, agent, name, url, id_, attributes=None,
       raw_attributes=None):
         self.attributes = attributes or dict()
@@ -304,27 +791,33 @@ class ChaseBankAccount(object):
         return self.name
 
     def __setattr__(self, name, value):
-        if name == 'attributes' or not hasattr(self, 'attributes'):
-            object.__setattr__(self, name, value)
-        elif name in self.attributes:
+        if name not in ChaseBankAccount.__slots__ and name in self.attributes:
             raise TypeError('Attribute "%s" is read-only.' % name)
-        else:
-            object.__setattr__(self, name, value)
+        object.__setattr__(self, name, value)
 
     def __getattr__(self, name):
+        # Only called for names that are not slots. The check keeps lookups
+        # made before the constructor has run, e.g. by the copy module, from
+        # recursing.
+        if name == 'attributes':
+            raise AttributeError('Attribute "%s" not found.' % name)
         try:
             return self.attributes[name]
         except KeyError:
             raise AttributeError('Attribute "%s" not found.' % name)
 
-    def transactions(self, since=None, through=None, maxpages=100):
+    def transactions(self, since=None, through=None, maxpages=100,
+      prefetch=0):
         """
         Get accounts transactions starting from the date specified by `since`
         through the date specified by `through`. If `since` is not specified,
         no lower bound is set, and when `through` not specified, no upper bound
         on the transaction dates is set. The number of pages of transactions
         that will be examined regardless of the date range can is controlled by
-        the value of `maxpages`.
+        the value of `maxpages`. When `prefetch` is non-zero, up to that many
+        of the following pages are downloaded in the background while the
+        current page is being processed; pages that are fetched ahead may end
+        up being discarded if the date range ends before they are reached.
         """
         # Column names -> Transaction constructor values
         row_key_map = {
@@ -345,19 +838,22 @@ class ChaseBankAccount(object):
 
         now = datetime.datetime.now()
 
-        page = self.url
-        nones = [None for _ in range(len(self.transaction_class._fields))]
-        constructor_defaults = zip(self.transaction_class._fields, nones)
-        constructor = dict(constructor_defaults)
-        while maxpages:
-            maxpages -= 1
-            soup = bs4.BeautifulSoup(self.agent.navigate(page))
+        if prefetch:
+            pages = self._prefetched_pages(maxpages, prefetch)
+        else:
+            pages = self._pages(self.agent, maxpages)
+
+        recorder = self.agent.instrumentation
+        constructor_defaults = dict.fromkeys(self.transaction_class._fields)
+        constructor = constructor_defaults.copy()
+        for soup in pages:
             tables = soup.find_all('table')
             # For some reason, the transactions page has an empty table.
             if len(tables) != 2:
                 raise ValueError('Expected 2 tables, found %d.' % len(tables))
 
             table = tables[1]
+            page_transactions = 0
             for row in table.find_all('tr'):
                 columns = row.find_all('td')
 
@@ -365,54 +861,176 @@ class ChaseBankAccount(object):
                     rowtext = ' '.join(row.find_all(text=True)).strip()
                     if constructor['name'] is None:
                         # Condense concurrent whitespace into a single space.
-                        constructor['name'] = re.sub('\s+', ' ', rowtext)
+                        constructor['name'] = rows.WHITESPACE_REGEX.sub(' ',
+                            rowtext)
 
                     elif row.hr:
+                        page_transactions += 1
                         transaction = self.transaction_class(**constructor)
                         if (transaction.date or now) < since:
+                            if recorder is not None:
+                                recorder.observe('transactions.rows',
+                                    page_transactions)
                             return
 
                         if through >= (transaction.date or now) >= since:
                             yield transaction
-                        constructor = dict(constructor_defaults)
+                        constructor = constructor_defaults.copy()
 
                 else:
                     # Refer to [A] for commentary.
                     left_column, right_column = columns
-                    key = wordize(' '.join(left_column.contents))
+                    key = rows.label_key(rows.cell_text(left_column))
                     try:
                         constructor_key = row_key_map[key]
                     except KeyError:
                         # XXX: Should probably log a warning
                         continue
 
-                    value = ' '.join(right_column.contents).strip()
+                    value = rows.cell_text(right_column)
                     if value.startswith(('$', '-$')):
-                        value = decimal.Decimal(re.sub('[^0-9.-]+', '', value))
+                        value = rows.parse_amount(value)
                     elif value == '--' or (not value and key != 'memo'):
                         value = None
                     elif constructor_key == 'date':
                         if value == 'Pending':
                             value = None
                         else:
-                            m, d, y = map(int, value.split('/'))
-                            value = datetime.datetime(y, m, d)
+                            value = rows.parse_date(value)
 
                     constructor[constructor_key] = value
 
+            if recorder is not None:
+                recorder.observe('transactions.rows', page_transactions)
+
+    def batch(self, since=None, through=None, maxpages=100, prefetch=0):
+        """
+        Return the account's transactions as a coba.batch.TransactionBatch,
+        which needs much less memory than a list when there are many of them.
+        The arguments are passed to ChaseBankAccount.transactions.
+        """
+        return batch.TransactionBatch(self.transaction_class,
+            self.transactions(since, through, maxpages, prefetch))
+
+    def export(self, fileobj, format='jsonl', since=None, through=None,
+      maxpages=100, prefetch=0):
+        """
+        Write the account's transactions to `fileobj` as JSON Lines or CSV
+        depending on `format` and return the number of transactions written.
+        Transactions are written as they are parsed, so memory use does not
+        grow with the number of transactions. See coba.export.Exporter for
+        details of the output, and the remaining arguments are passed to
+        ChaseBankAccount.transactions.
+        """
+        transactions = self.transactions(since, through, maxpages, prefetch)
+        return export.write_transactions(fileobj,
+            ((self, transaction) for transaction in transactions), format)
+
+    def _pages(self, agent, maxpages):
+        """
+        Yield the parsed pages of the account's transactions using `agent` to
+        fetch them.
+        """
+        page = self.url
+        while maxpages:
+            maxpages -= 1
+            agent.navigate(page)
+            soup = agent.parse(_TABLES_AND_LINKS_ONLY)
+            yield soup
+
             try:
                 page = soup.find(text='Next').parent['href']
             except AttributeError:
                 # No more pages
                 return
 
+    def _prefetched_pages(self, maxpages, prefetch):
+        """
+        Yield the parsed pages of the account's transactions while a thread
+        using a fork of the agent downloads up to `prefetch` pages ahead.
+        """
+        # Each slot is a page that may be fetched before the page currently
+        # being processed is done.
+        slots = threading.Semaphore(prefetch)
+        stop = threading.Event()
+        pages = Queue.Queue()
+
+        def fetch():
+            try:
+                for soup in self._pages(self.agent.fork(), maxpages):
+                    pages.put(soup)
+                    slots.acquire()
+                    if stop.is_set():
+                        return
+            except Exception as exc:
+                pages.put(exc)
+            finally:
+                pages.put(None)
+
+        thread = threading.Thread(target=fetch)
+        thread.daemon = True
+        thread.start()
+
+        # When the consumer stops early, the generator is closed and the
+        # fetching thread is released so it can exit.
+        try:
+            while True:
+                page = pages.get()
+                if page is None:
+                    return
+                elif isinstance(page, Exception):
+                    raise page
+
+                yield page
+                slots.release()
+        finally:
+            stop.set()
+            slots.release()
+
+    def bind(self, agent):
+        """
+        Return a copy of this account that uses `agent` to access Chase Online.
+        """
+        return type(self)(agent=agent, name=self.name, url=self.url,
+            id_=self.id_, attributes=self.attributes,
+            raw_attributes=self.raw_attributes)
+
+    def sync(self, store, maxpages=100, overlap_days=14):
+        """
+        Save the transactions that have posted since the account was last
+        synchronized into `store`, a coba.store.TransactionStore instance, and
+        return the number of new transactions. Pages are only fetched until
+        `overlap_days` days before the most recent transaction already in the
+        store, so `maxpages` only matters for the first synchronization.
+        """
+        # Pending transactions are not stored, and once they post, they are
+        # usually dated before the most recent stored transaction, so the
+        # last `overlap_days` days are fetched again. The store ignores the
+        # transactions it already has.
+        since = store.high_water_mark(self.id_)
+        if since is not None:
+            since -= datetime.timedelta(days=overlap_days)
+
+        # Synchronization is not something anybody is waiting for, so when
+        # requests are scheduled, they yield to interactive ones.
+        account = self
+        if (self.agent.scheduler is not None and
+          self.agent.priority != scheduler.BACKGROUND):
+            agent = self.agent.fork()
+            agent.priority = scheduler.BACKGROUND
+            account = self.bind(agent)
+
+        return store.add(self, account.transactions(since, maxpages=maxpages))
+
 
 class ChaseCreditAccount(ChaseBankAccount):
     """
     Credit banking account, i.e. credit cards.
     """
+    __slots__ = ()
     transaction_class = CreditAccountTransaction
 
+    @_invalidates_accounts
     def pay_from(self, other, amount, date=None):
         """
         Pay off account balance using a debit account. The amount can be a
@@ -440,7 +1058,8 @@ class ChaseCreditAccount(ChaseBankAccount):
                 raise ValueError('%r does not appear to be a number.' % amount)
 
         # Find the URL used to initiate a transfer to the other account
-        soup = bs4.BeautifulSoup(self.agent.navigate(self.payment_url))
+        self.agent.navigate(self.payment_url)
+        soup = self.agent.parse(_LINKS_ONLY)
         regex = re.compile(re.escape(other.name))
         match = soup.find('a', text=regex)
 
@@ -451,7 +1070,8 @@ class ChaseCreditAccount(ChaseBankAccount):
 
         # Scan page for payment options
         payment_type_map = dict()
-        soup = bs4.BeautifulSoup(self.agent.navigate(url))
+        self.agent.navigate(url)
+        soup = self.agent.soup
         options = soup.find_all(id='PaymentOptionId')
         if not options:
             # XXX: Should probably pick a better exception
@@ -482,18 +1102,17 @@ class ChaseCreditAccount(ChaseBankAccount):
         self.agent.browser.getControl(name='Submit').click()
         self.agent.check_for_errors()
 
-        soup = bs4.BeautifulSoup(self.agent.browser.contents)
+        soup = self.agent.parse(_TABLES_ONLY)
         tables = soup.find_all('table')
         if len(tables) != 1:
             raise ValueError('Expected 1 table, found %d.' % len(tables))
 
         table = tables[0]
-        rows = table.find_all('tr')
-        for row in rows:
+        for row in table.find_all('tr'):
             row_text = ' '.join(row.find_all(text=True)).strip()
             if 'Total payment amount:' in row_text:
                 usd = row_text.split()[-1]
-                payment = decimal.Decimal(re.sub('[^0-9.-]+', '', usd))
+                payment = rows.parse_amount(usd)
                 break
         else:
             raise Exception('Could not scrape total payment amount.')
@@ -527,8 +1146,10 @@ class ChaseDebitAccount(ChaseBankAccount):
     """
     Debit banking account, e.g. savings and checking.
     """
+    __slots__ = ()
     transaction_class = DebitAccountTransaction
 
+    @_invalidates_accounts
     def transfer_to(self, other, amount, memo='', date=None):
         """
         Transfer funds from this debit account to another debit account. The
@@ -543,7 +1164,8 @@ class ChaseDebitAccount(ChaseBankAccount):
             raise ValueError('%r does not appear to be a number.' % amount)
 
         # Find the URL used to initiate a transfer to the other account
-        soup = bs4.BeautifulSoup(self.agent.navigate(self.transfer_from_url))
+        self.agent.navigate(self.transfer_from_url)
+        soup = self.agent.parse(_LINKS_ONLY)
         for link in soup.find_all('a'):
             url = link['href']
             if re.search('\\btoId=%s\\b' % other.id_, url):
@@ -582,9 +1204,92 @@ class ChaseDebitAccount(ChaseBankAccount):
         other.transfer_to(self, amount, memo=memo, date=date)
 
 
-def wordize(text):
+def concurrent_transactions(accounts, since=None, through=None, maxpages=100,
+  workers=4):
+    """
+    Fetch the transactions of several accounts at once using up to `workers`
+    threads, each of which uses a fork of the account's agent. A list with the
+    transactions of each account is returned in the same order as `accounts`.
+    The remaining arguments are passed to ChaseBankAccount.transactions.
+    """
+    accounts = list(accounts)
+    if len(accounts) < 2 or workers < 2:
+        return [list(account.transactions(since, through, maxpages))
+            for account in accounts]
+
+    def fetch(account):
+        account = account.bind(account.agent.fork())
+        return list(account.transactions(since, through, maxpages))
+
+    pool = multiprocessing.pool.ThreadPool(min(workers, len(accounts)))
+    try:
+        return pool.map(fetch, accounts)
+    finally:
+        pool.terminate()
+
+
+def merged_transactions(accounts, since=None, through=None, maxpages=100,
+  prefetch=1):
     """
-    Replace characters not matching the regex "[a-z0-9_+]+" with
-    underscores and remove any trailing and leading underscores.
+    Yield the transactions of several accounts from newest to oldest as they
+    are downloaded, with pending transactions first. Since each account's
+    transactions are already in that order, they are merged as they arrive so
+    only the next transaction of every account is held in memory instead of
+    every transaction of every account. Each account downloads up to
+    `prefetch` pages ahead in the background using a fork of its agent, in
+    which case the first pages of every account are downloaded in parallel,
+    and the remaining arguments are passed to ChaseBankAccount.transactions.
     """
-    return re.sub('\\b_|_\\b', '', re.sub('[^a-z0-9_-]+', '_', text.lower()))
+    heap = list()
+    iterators = list()
+
+    def push(index, transaction):
+        if transaction is None:
+            return
+        if transaction.date is None:
+            key = (False, None)
+        else:
+            key = (True, datetime.datetime.max - transaction.date)
+        # The index keeps accounts in their original order when dates are the
+        # same and ensures transactions are never compared.
+        heapq.heappush(heap, (key, index, transaction))
+
+    try:
+        for account in accounts:
+            iterators.append(account.transactions(since, through, maxpages,
+                prefetch))
+
+        # Accounts only start downloading pages once their generator is first
+        # advanced, so when pages are fetched by forks, every generator is
+        # advanced at once instead of each waiting for the previous one's
+        # first page. Without prefetching, the accounts' agent is shared, and
+        # a browser can only load one page at a time.
+        if prefetch and len(iterators) > 1:
+            pool = multiprocessing.pool.ThreadPool(len(iterators))
+            try:
+                results = [pool.apply_async(next, (transactions, None))
+                    for transactions in iterators]
+                # Every generator must be done before any of them is closed.
+                for result in results:
+                    result.wait()
+                firsts = [result.get() for result in results]
+            finally:
+                pool.terminate()
+        else:
+            firsts = [next(transactions, None) for transactions in iterators]
+
+        for index, transaction in enumerate(firsts):
+            push(index, transaction)
+
+        while heap:
+            _, index, transaction = heapq.heappop(heap)
+            yield transaction
+            push(index, next(iterators[index], None))
+
+    finally:
+        for transactions in iterators:
+            transactions.close()
+
+
+# The implementation moved to coba.rows along with the rest of the row parsing.
+wordize = rows.wordize
@@ -0,0 +1,273 @@
+#!/usr/bin/env python
+"""
+Recording and replaying of the HTTP traffic of agents. An agent created with
+an HTTPArchive in "record" mode saves every response its browser receives,
+and an agent using the same archive in "replay" mode is served those
+responses from memory without touching the network, so scrapers can be
+profiled and tested repeatedly without logging in or moving money.
+
+Archives are gzip-compressed streams of pickled records, and identical
+response bodies are only stored once. Request bodies and headers are never
+stored. Only the digests of request bodies are, and the user ID, password and
+verification code fields of forms are left out of those. The values of
+cookies set by responses are replaced with REDACTED, so archives do not hold
+session tokens. Responses are still private banking data, so archives are
+only readable by their owner.
+"""
+__author__ = "Eric Pruitt <eric.pruitt@gmail.com>"
+__license__ = "2-Clause BSD"
+
+import collections
+import gzip
+import hashlib
+import os
+import threading
+import urllib
+import urlparse
+
+import mechanize
+
+try:
+    import cPickle as pickle
+except ImportError:
+    import pickle
+
+__all__ = ["HTTPArchive", "NotRecordedError", "RECORD", "REPLAY"]
+
+RECORD = 'record'
+REPLAY = 'replay'
+
+# Form fields left out of request digests since the digest of a form holding
+# the user ID and password could be brute-forced to recover the password.
+CREDENTIAL_FIELDS = frozenset(['auth_userId', 'auth_passwd', 'auth_otp'])
+
+# Response headers setting cookies, whose values are session tokens, and the
+# value they are recorded with instead.
+COOKIE_HEADERS = frozenset(['set-cookie', 'set-cookie2'])
+REDACTED = 'REDACTED'
+
+Record = collections.namedtuple('Record',
+    'method url request_digest code msg headers body_digest')
+
+
+class NotRecordedError(mechanize.URLError):
+    """
+    Raised when a request that is not in the archive is made while replaying.
+    """
+
+
+def _request_digest(method, url, data):
+    if data:
+        fields = urlparse.parse_qsl(data, keep_blank_values=True)
+        if any(name in CREDENTIAL_FIELDS for name, _ in fields):
+            data = urllib.urlencode([(name, value) for name, value in fields
+                if name not in CREDENTIAL_FIELDS])
+    return hashlib.sha1('%s\0%s\0%s' % (method, url, data or '')).digest()
+
+
+def _redact_cookie(header):
+    """
+    Return a Set-Cookie header with the value of the cookie replaced by
+    REDACTED while keeping its name and attributes.
+    """
+    cookie, separator, attributes = header.partition(';')
+    name, equals, _ = cookie.partition('=')
+    if not equals:
+        return header
+    return '%s=%s%s%s' % (name, REDACTED, separator, attributes)
+
+
+def _header_pairs(message):
+    """
+    Return the headers of a mimetools.Message as (name, value) pairs in their
+    original order, so repeated headers like Set-Cookie are preserved.
+    """
+    pairs = list()
+    for line in message.headers:
+        if line[:1].isspace() and pairs:
+            name, value = pairs.pop()
+            pairs.append((name, value + ' ' + line.strip()))
+        elif ':' in line:
+            name, value = line.split(':', 1)
+            pairs.append((name.strip(), value.strip()))
+    return pairs
+
+
+class HTTPArchive(object):
+    """
+    Archive of HTTP responses stored in the file at `path`. In RECORD mode,
+    the file is truncated and every response received by browsers using the
+    archive is appended to it as it arrives. In REPLAY mode, the archive is
+    loaded into memory, and requests are answered with the recorded responses
+    to the same method, URL and request body in the order they were recorded,
+    with the last one being repeated once they have all been served. Requests
+    whose body differs from the recorded one, e.g. forms containing the
+    current date, fall back to responses to the same method and URL.
+
+    Cookies set by recorded responses are replayed with REDACTED as their
+    value, so replayed sessions cannot be resumed against the real site.
+
+    Archives are thread-safe, so forked agents can share them.
+    """
+    def __init__(self, path, mode=REPLAY):
+        if mode not in (RECORD, REPLAY):
+            raise ValueError('Mode must be %r or %r.' % (RECORD, REPLAY))
+
+        self.path = path
+        self.mode = mode
+        self._lock = threading.Lock()
+        self._bodies = dict()
+        self._records = list()
+        # Indexes of the records answering each request digest and each
+        # method and URL, and the records that have been served.
+        self._exact = collections.defaultdict(list)
+        self._loose = collections.defaultdict(list)
+        self._served = set()
+        self._file = None
+
+        if mode == RECORD:
+            fd = os.open(path, os.O_WRONLY | os.O_CREAT | os.O_TRUNC, 0o600)
+            self._file = gzip.GzipFile(fileobj=os.fdopen(fd, 'wb'),
+                mode='wb')
+        else:
+            self._load()
+
+    def __len__(self):
+        return len(self._records)
+
+    def _load(self):
+        with gzip.open(self.path, 'rb') as iostream:
+            while True:
+                try:
+                    record, body = pickle.load(iostream)
+                except EOFError:
+                    break
+                except (IOError, pickle.UnpicklingError):
+                    # The recording was interrupted before the archive was
+                    # closed, so the last record is incomplete.
+                    break
+                self._add(Record(*record), body)
+
+    def _add(self, record, body):
+        """
+        Index a record and return True if its body had not been seen before.
+        """
+        index = len(self._records)
+        self._records.append(record)
+        self._exact[record.request_digest].append(index)
+        self._loose[(record.method, record.url)].append(index)
+        if record.body_digest in self._bodies:
+            return False
+        self._bodies[record.body_digest] = body
+        return True
+
+    def record(self, request, response):
+        """
+        Save a response and return an equivalent one that has not been read.
+        """
+        method = request.get_method()
+        url = request.get_full_url()
+        body = response.read()
+        headers = _header_pairs(response.info())
+        # The response handed back keeps its cookies so the session being
+        # recorded goes on working.
+        recorded_headers = [(name, _redact_cookie(value)
+            if name.lower() in COOKIE_HEADERS else value)
+            for name, value in headers]
+        code = getattr(response, 'code', 200)
+        msg = getattr(response, 'msg', 'OK')
+
+        record = Record(method, url, _request_digest(method, url,
+            request.get_data()), code, msg, recorded_headers,
+            hashlib.sha1(body).digest())
+        with self._lock:
+            new_body = self._add(record, body)
+            pickle.dump((tuple(record), body if new_body else None),
+                self._file, pickle.HIGHEST_PROTOCOL)
+            # Flushing keeps everything recorded so far readable if the
+            # program dies before the archive is closed.
+            self._file.flush()
+
+        return mechanize.make_response(body, headers, response.geturl(), code,
+            msg)
+
+    def replay(self, request):
+        """
+        Return the recorded response to a request.
+        """
+        method = request.get_method()
+        url = request.get_full_url()
+        digest = _request_digest(method, url, request.get_data())
+
+        with self._lock:
+            for candidates in (self._exact.get(digest),
+              self._loose.get((method, url))):
+                if not candidates:
+                    continue
+                # Once every candidate has been served, the last one is.
+                for index in candidates:
+                    if index not in self._served:
+                        break
+                self._served.add(index)
+                break
+            else:
+                raise NotRecordedError('%s %s was not recorded.' % (method,
+                    url))
+
+        record = self._records[index]
+        return mechanize.make_response(self._bodies[record.body_digest],
+            record.headers, url, record.code, record.msg)
+
+    def rewind(self):
+        """
+        Serve responses from the beginning of the recording again.
+        """
+        with self._lock:
+            self._served.clear()
+
+    def handler(self):
+        """
+        Return a mechanize handler that records responses or replays them
+        depending on the mode of the archive.
+        """
+        if self.mode == RECORD:
+            return _RecordingHandler(self)
+        return _ReplayingHandler(self)
+
+    def close(self):
+        """
+        Finish writing the archive when recording.
+        """
+        with self._lock:
+            if self._file is not None:
+                fileobj = self._file.fileobj
+                self._file.close()
+                fileobj.close()
+                self._file = None
+
+
+class _RecordingHandler(mechanize.BaseHandler):
+    # Processors run in ascending order, so responses are recorded before
+    # redirections, cookies and errors are handled.
+    handler_order = 50
+
+    def __init__(self, archive):
+        self.archive = archive
+
+    def http_response(self, request, response):
+        return self.archive.record(request, response)
+
+    https_response = http_response
+
+
+class _ReplayingHandler(mechanize.BaseHandler):
+    # Consulted before the handlers that would open a connection.
+    handler_order = 50
+
+    def __init__(self, archive):
+        self.archive = archive
+
+    def http_open(self, request):
+        return self.archive.replay(request)
+
+    https_open = http_open
@@ -0,0 +1,108 @@
+#!/usr/bin/env python
+"""
+Non-blocking interface to Chase Online Banking. Every operation returns a
+Future immediately and runs on a thread belonging to the agent, so a single
+event loop can drive many sessions without blocking on any of them.
+"""
+__author__ = "Eric Pruitt <eric.pruitt@gmail.com>"
+__license__ = "2-Clause BSD"
+
+import concurrent.futures
+
+import coba
+
+__all__ = ["AsyncChaseOnlineBankingAgent", "Future", "TimeoutError"]
+
+# Operations return concurrent.futures.Future instances so they can be wrapped
+# by event loops, e.g. with asyncio.wrap_future or its trollius equivalent.
+Future = concurrent.futures.Future
+TimeoutError = concurrent.futures.TimeoutError
+
+
+class AsyncChaseOnlineBankingAgent(object):
+    """
+    Wrapper around a ChaseOnlineBankingAgent whose methods return Future
+    instances instead of blocking. Each agent has an executor with a single
+    thread, so operations on the same agent run one at a time in the order
+    they were submitted since an agent's browser can only do one thing at a
+    time, but operations on different agents run concurrently. Cancelling the
+    Future of an operation that has not started yet skips it.
+    """
+    def __init__(self, agent, executor=None):
+        self.agent = agent
+        self.executor = executor or concurrent.futures.ThreadPoolExecutor(
+            max_workers=1)
+
+    @classmethod
+    def connect(cls, *args, **kwargs):
+        """
+        Create a ChaseOnlineBankingAgent in the background and return a Future
+        whose result is an AsyncChaseOnlineBankingAgent wrapping it. The
+        arguments are passed to the ChaseOnlineBankingAgent constructor.
+        """
+        executor = concurrent.futures.ThreadPoolExecutor(max_workers=1)
+
+        def create():
+            try:
+                agent = coba.ChaseOnlineBankingAgent(*args, **kwargs)
+            except Exception:
+                executor.shutdown(wait=False)
+                raise
+            return cls(agent, executor=executor)
+
+        return executor.submit(create)
+
+    def run(self, function, *args, **kwargs):
+        """
+        Call `function` with the remaining arguments once every previously
+        submitted operation on this agent has finished, and return a Future
+        for its result.
+        """
+        return self.executor.submit(function, *args, **kwargs)
+
+    def shutdown(self, wait=True):
+        """
+        Stop accepting operations and let the agent's thread exit once the
+        ones already submitted have finished, waiting for them if `wait` is
+        set.
+        """
+        self.executor.shutdown(wait=wait)
+
+    def navigate(self, url):
+        """
+        Asynchronous ChaseOnlineBankingAgent.navigate.
+        """
+        return self.run(self.agent.navigate, url)
+
+    def login(self, *args, **kwargs):
+        """
+        Asynchronous ChaseOnlineBankingAgent.login. The `otp_prompt_call`
+        argument, if any, is called from the agent's thread.
+        """
+        return self.run(self.agent.login, *args, **kwargs)
+
+    def accounts(self):
+        """
+        Return a Future whose result is a list of the user's accounts.
+        """
+        return self.run(lambda: list(self.agent.accounts))
+
+    def transactions(self, account, *args, **kwargs):
+        """
+        Return a Future whose result is a list of the account's transactions.
+        The remaining arguments are passed to ChaseBankAccount.transactions.
+        """
+        return self.run(lambda: list(account.transactions(*args, **kwargs)))
+
+    def transfer_to(self, source, destination, *args, **kwargs):
+        """
+        Asynchronous ChaseDebitAccount.transfer_to.
+        """
+        return self.run(source.transfer_to, destination, *args, **kwargs)
+
+    def pay_from(self, credit_account, debit_account, *args, **kwargs):
+        """
+        Asynchronous ChaseCreditAccount.pay_from.
+        """
+        return self.run(credit_account.pay_from, debit_account, *args,
+            **kwargs)
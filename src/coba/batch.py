@@ -0,0 +1,130 @@
+#!/usr/bin/env python
+"""
+Columnar storage for large numbers of transactions.
+"""
+__author__ = "Eric Pruitt <eric.pruitt@gmail.com>"
+__license__ = "2-Clause BSD"
+
+import array
+import datetime
+import decimal
+
+__all__ = ["TransactionBatch", "MISSING"]
+
+# Value stored in the date and amount columns in place of None.
+MISSING = -2 ** 31
+
+# Fields stored as integers: dates as proleptic Gregorian ordinals and
+# monetary amounts as cents.
+DATE_FIELDS = ('date', )
+AMOUNT_FIELDS = ('amount', 'balance')
+
+
+class TransactionBatch(object):
+    """
+    Transactions of a single type stored as parallel columns instead of one
+    object per transaction. Dates and amounts are kept in arrays of machine
+    integers and text is shared between transactions with the same values, so
+    a batch takes a fraction of the memory of the equivalent list of
+    transactions. Transactions are only created when a batch is indexed or
+    iterated over.
+
+    The columns are available as `columns`, a dictionary mapping each field of
+    `transaction_class` to an `array.array` of date ordinals or cents, with
+    MISSING in place of None, or a list for the other fields. The `dates`,
+    `amounts` and `names` attributes are shortcuts for the most commonly used
+    columns.
+    """
+    __slots__ = ('transaction_class', 'columns', '_strings')
+
+    def __init__(self, transaction_class, transactions=()):
+        self.transaction_class = transaction_class
+        self.columns = dict()
+        self._strings = dict()
+        for field in transaction_class._fields:
+            if field in DATE_FIELDS or field in AMOUNT_FIELDS:
+                self.columns[field] = array.array('l')
+            else:
+                self.columns[field] = list()
+
+        self.extend(transactions)
+
+    def __len__(self):
+        return len(self.columns[self.transaction_class._fields[0]])
+
+    def __getitem__(self, index):
+        values = list()
+        for field in self.transaction_class._fields:
+            value = self.columns[field][index]
+            if field in DATE_FIELDS:
+                value = _date(value)
+            elif field in AMOUNT_FIELDS:
+                value = _amount(value)
+            values.append(value)
+
+        return self.transaction_class(*values)
+
+    def __iter__(self):
+        for index in xrange(len(self)):
+            yield self[index]
+
+    @property
+    def dates(self):
+        return self.columns['date']
+
+    @property
+    def amounts(self):
+        return self.columns['amount']
+
+    @property
+    def names(self):
+        return self.columns['name']
+
+    def append(self, transaction):
+        """
+        Add a transaction to the end of the batch. A ValueError is raised if
+        the transaction has a time of day or an amount with fractions of a
+        cent since they cannot be stored exactly.
+        """
+        values = list()
+        for field, value in zip(self.transaction_class._fields, transaction):
+            if value is None:
+                if field in DATE_FIELDS or field in AMOUNT_FIELDS:
+                    value = MISSING
+            elif field in DATE_FIELDS:
+                if value.time() != datetime.time():
+                    raise ValueError('Date %s has a time of day.' % value)
+                value = value.toordinal()
+            elif field in AMOUNT_FIELDS:
+                cents = value.scaleb(2)
+                if cents != cents.to_integral_value():
+                    raise ValueError('Amount %s has fractions of a cent.' %
+                        value)
+                value = int(cents)
+            elif isinstance(value, basestring):
+                value = self._strings.setdefault(value, value)
+            values.append((field, value))
+
+        # Columns are only changed once every value has been converted so a
+        # rejected transaction does not leave them with different lengths.
+        for field, value in values:
+            self.columns[field].append(value)
+
+    def extend(self, transactions):
+        """
+        Add every transaction from an iterable to the end of the batch.
+        """
+        for transaction in transactions:
+            self.append(transaction)
+
+
+def _date(ordinal):
+    if ordinal == MISSING:
+        return None
+    return datetime.datetime.fromordinal(ordinal)
+
+
+def _amount(cents):
+    if cents == MISSING:
+        return None
+    return decimal.Decimal(cents).scaleb(-2)
@@ -0,0 +1,170 @@
+#!/usr/bin/env python
+"""
+Machine-readable export of accounts and transactions as JSON Lines or CSV.
+"""
+__author__ = "Eric Pruitt <eric.pruitt@gmail.com>"
+__license__ = "2-Clause BSD"
+
+import csv
+import datetime
+import decimal
+import json
+
+__all__ = ["FORMATS", "TRANSACTION_FIELDS", "Exporter", "account_record",
+    "transaction_record", "write_accounts", "write_transactions"]
+
+FORMATS = ('jsonl', 'csv')
+
+# Columns of exported transactions. Fields that a transaction class does not
+# have are left empty.
+TRANSACTION_FIELDS = ('account_id', 'account_name', 'date', 'name', 'type',
+    'id', 'amount', 'balance', 'memo')
+
+# Number of records encoded before they are written out together.
+BUFFERED_RECORDS = 512
+
+
+class _Chunks(list):
+    """
+    List that can be used as the file object of a CSV writer.
+    """
+    write = list.append
+
+
+class Exporter(object):
+    """
+    Writes records, mappings of the names in `fields` to values, to `fileobj`
+    in the given format. Records are encoded as they are written, so memory
+    use does not depend on the number of records, and the encoded records are
+    written in batches to reduce the number of calls to `fileobj.write`.
+
+    Amounts are written exactly as they are stored: as bare numbers in JSON,
+    which can be read back with `json.loads(line, parse_float=Decimal)`, and
+    as-is in CSV. Dates are written in ISO 8601 format, and missing values
+    are written as "null" in JSON and left empty in CSV. Text is encoded as
+    UTF-8.
+    """
+    def __init__(self, fileobj, format='jsonl', fields=TRANSACTION_FIELDS):
+        if format not in FORMATS:
+            raise ValueError('Unsupported export format "%s".' % format)
+
+        self.fileobj = fileobj
+        self.format = format
+        self.fields = fields
+        self.count = 0
+        self._chunks = _Chunks()
+        if format == 'csv':
+            self._csv = csv.writer(self._chunks, lineterminator='\n')
+            self._csv.writerow([field.encode('utf-8') for field in fields])
+
+    def write(self, record):
+        """
+        Encode and buffer a record.
+        """
+        if self.format == 'csv':
+            self._csv.writerow(
+                [_csv_value(record.get(field)) for field in self.fields])
+        else:
+            self._chunks.append('{%s}\n' % ', '.join('%s: %s' % (
+                json.dumps(field), _json_value(record.get(field)))
+                for field in self.fields))
+
+        self.count += 1
+        if len(self._chunks) >= BUFFERED_RECORDS:
+            self.flush()
+
+    def flush(self):
+        """
+        Write out any buffered records.
+        """
+        if self._chunks:
+            self.fileobj.write(''.join(self._chunks))
+            del self._chunks[:]
+        self.fileobj.flush()
+
+
+def _text(value):
+    """
+    Return the text form of a value that is not None.
+    """
+    if isinstance(value, datetime.datetime) and (
+      value.time() == datetime.time()):
+        return value.date().isoformat()
+    elif isinstance(value, (datetime.date, datetime.datetime)):
+        return value.isoformat()
+    return value
+
+
+def _csv_value(value):
+    if value is None:
+        return ''
+    value = _text(value)
+    if isinstance(value, unicode):
+        return value.encode('utf-8')
+    return str(value)
+
+
+def _json_value(value):
+    if value is None:
+        return 'null'
+    elif isinstance(value, decimal.Decimal) and value.is_finite():
+        return str(value)
+    return json.dumps(_text(value), default=unicode)
+
+
+def transaction_record(account, transaction):
+    """
+    Return the exported fields of a transaction belonging to `account`.
+    """
+    record = transaction._asdict()
+    record['account_id'] = account.id_
+    record['account_name'] = account.name
+    return record
+
+
+def account_record(account):
+    """
+    Return the exported fields of an account: its identifier, name, kind and
+    the attributes shown on the accounts page.
+    """
+    record = dict(getattr(account, 'attributes', None) or dict())
+    if getattr(account, 'rewards_program', None):
+        record['rewards_program'] = account.rewards_program
+    record['id'] = account.id_
+    record['name'] = account.name
+    record['kind'] = getattr(account, 'kind', None) or type(account).__name__
+    return record
+
+
+def write_transactions(fileobj, rows, format='jsonl'):
+    """
+    Export `rows`, an iterable of account and transaction pairs, to `fileobj`
+    and return the number of transactions written. The rows are consumed
+    lazily, so a generator of transactions is exported in a single pass
+    without being held in memory.
+    """
+    exporter = Exporter(fileobj, format, TRANSACTION_FIELDS)
+    for account, transaction in rows:
+        exporter.write(transaction_record(account, transaction))
+    exporter.flush()
+    return exporter.count
+
+
+def write_accounts(fileobj, accounts, format='jsonl'):
+    """
+    Export accounts to `fileobj` and return the number of accounts written.
+    Since accounts of different kinds have different attributes, the columns
+    are the union of the attributes of every account.
+    """
+    records = [account_record(account) for account in accounts]
+    attributes = set()
+    for record in records:
+        attributes.update(record)
+    fields = ['id', 'name', 'kind']
+    fields.extend(sorted(attributes.difference(fields)))
+
+    exporter = Exporter(fileobj, format, fields)
+    for record in records:
+        exporter.write(record)
+    exporter.flush()
+    return exporter.count
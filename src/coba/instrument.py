@@ -0,0 +1,187 @@
+#!/usr/bin/env python
+"""
+Instrumentation of the agent and of the HTTPS transport. Instrumented code
+reports events to a recorder, an object with two methods:
+
+- observe(name, value): adds a sample, usually a duration in seconds, to the
+  histogram `name`.
+- count(name, amount=1): adds `amount` to the counter `name`.
+
+Agents report to the recorder given as their "instrumentation" argument, and
+the transport reports to the one set with `install`. When no recorder is set,
+the instrumented code only compares an attribute with None, so it costs
+nothing worth measuring.
+
+Events reported by ChaseOnlineBankingAgent:
+
+- navigate: seconds spent in each call to navigate.
+- relogin: seconds spent logging in again when navigate lands on the log-in
+  form.
+- parse: seconds spent building each BeautifulSoup tree.
+- parse.cached: counter of parses avoided thanks to the cache.
+- check_for_errors: seconds spent in each call to check_for_errors.
+- transactions.rows: number of transactions found on each page of activity.
+- schedule: seconds each request waited for its coba.scheduler.Scheduler.
+- session.refresh: seconds spent on each request made to keep an idle session
+  from expiring.
+
+Events reported by coba.urllib2_ssl:
+
+- dns: seconds spent in each call to the resolver.
+- dns.cached: counter of addresses served from the cache.
+- connect: seconds spent establishing each TCP connection, DNS lookup
+  included.
+- handshake: seconds spent on each TLS handshake and certificate check.
+- connection.reused: counter of requests sent over pooled connections.
+- request_bytes, response_bytes: counters of bytes sent and received.
+"""
+__author__ = "Eric Pruitt <eric.pruitt@gmail.com>"
+__license__ = "2-Clause BSD"
+
+import math
+import threading
+
+import urllib2_ssl
+
+__all__ = ["Histogram", "Stats", "install", "uninstall"]
+
+
+def install(recorder):
+    """
+    Report events of the HTTPS transport to `recorder` and return it.
+    """
+    urllib2_ssl.instrumentation = recorder
+    return recorder
+
+
+def uninstall():
+    """
+    Stop reporting events of the HTTPS transport.
+    """
+    urllib2_ssl.instrumentation = None
+
+
+class Histogram(object):
+    """
+    Distribution of samples kept as counts in buckets whose bounds are powers
+    of two, so memory use does not depend on the number of samples.
+    Percentiles are estimated from the upper bounds of the buckets and are
+    therefore at most twice the actual value.
+    """
+    __slots__ = ('count', 'total', 'minimum', 'maximum', 'buckets')
+
+    def __init__(self):
+        self.count = 0
+        self.total = 0.0
+        self.minimum = None
+        self.maximum = None
+        self.buckets = dict()
+
+    def add(self, value):
+        """
+        Add a sample to the histogram.
+        """
+        self.count += 1
+        self.total += value
+        if self.minimum is None or value < self.minimum:
+            self.minimum = value
+        if self.maximum is None or value > self.maximum:
+            self.maximum = value
+
+        # The bucket of a sample is the exponent of the smallest power of two
+        # that is at least as large as the sample. Zero and negative samples
+        # share a bucket.
+        exponent = math.frexp(value)[1] if value > 0 else None
+        self.buckets[exponent] = self.buckets.get(exponent, 0) + 1
+
+    @property
+    def mean(self):
+        return self.total / self.count if self.count else 0.0
+
+    def percentile(self, fraction):
+        """
+        Return an estimate of the value below which `fraction` of the samples
+        fall.
+        """
+        if not self.count:
+            return 0.0
+
+        rank = max(1, int(math.ceil(fraction * self.count)))
+        seen = 0
+        for exponent in sorted(self.buckets, key=lambda e: (e is not None, e)):
+            seen += self.buckets[exponent]
+            if seen >= rank:
+                if exponent is None:
+                    return min(self.maximum, 0)
+                return min(self.maximum, math.ldexp(1, exponent))
+
+        return self.maximum
+
+
+class Stats(object):
+    """
+    Default recorder that aggregates samples into histograms and counters. It
+    is thread-safe, so it can be shared by forked agents, the transport and
+    prefetching threads.
+    """
+    def __init__(self):
+        self.histograms = dict()
+        self.counters = dict()
+        self._lock = threading.Lock()
+
+    def observe(self, name, value):
+        with self._lock:
+            try:
+                histogram = self.histograms[name]
+            except KeyError:
+                histogram = self.histograms[name] = Histogram()
+            histogram.add(value)
+
+    def count(self, name, amount=1):
+        with self._lock:
+            self.counters[name] = self.counters.get(name, 0) + amount
+
+    def reset(self):
+        """
+        Discard every sample and counter.
+        """
+        with self._lock:
+            self.histograms = dict()
+            self.counters = dict()
+
+    def snapshot(self):
+        """
+        Return the histograms and counters as a dictionary that can be
+        serialized as JSON.
+        """
+        with self._lock:
+            histograms = dict()
+            for name, histogram in self.histograms.items():
+                histograms[name] = {
+                    'count': histogram.count,
+                    'total': histogram.total,
+                    'mean': histogram.mean,
+                    'min': histogram.minimum,
+                    'max': histogram.maximum,
+                    'p50': histogram.percentile(0.50),
+                    'p90': histogram.percentile(0.90),
+                    'p99': histogram.percentile(0.99),
+                }
+            return {'histograms': histograms, 'counters': dict(self.counters)}
+
+    def report(self):
+        """
+        Return a table of the histograms followed by the counters as text.
+        """
+        snapshot = self.snapshot()
+        lines = ['%-20s %8s %10s %10s %10s %10s %10s' % ('event', 'count',
+            'total', 'mean', 'p50', 'p99', 'max')]
+        for name, values in sorted(snapshot['histograms'].items()):
+            lines.append('%-20s %8d %10.4g %10.4g %10.4g %10.4g %10.4g' % (
+                name, values['count'], values['total'], values['mean'],
+                values['p50'], values['p99'], values['max']))
+
+        for name, value in sorted(snapshot['counters'].items()):
+            lines.append('%-20s %8d' % (name, value))
+
+        return '\n'.join(lines)
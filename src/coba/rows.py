@@ -0,0 +1,95 @@
+#!/usr/bin/env python
+"""
+Conversion of the label and value cells of the account and transaction tables
+into Python values. The same handful of labels, dates and amount formats show
+up in every row, so patterns are compiled once and conversions of labels and
+dates are memoized.
+"""
+__author__ = "Eric Pruitt <eric.pruitt@gmail.com>"
+__license__ = "2-Clause BSD"
+
+import datetime
+import decimal
+import re
+
+__all__ = ["wordize", "label_key", "cell_text", "parse_amount", "parse_date"]
+
+NON_WORD_REGEX = re.compile('[^a-z0-9_-]+')
+EDGE_UNDERSCORE_REGEX = re.compile('\\b_|_\\b')
+NON_AMOUNT_REGEX = re.compile('[^0-9.-]+')
+WHITESPACE_REGEX = re.compile('\\s+')
+
+# Memoized conversions are discarded once a cache reaches this many entries so
+# pages with unexpected content cannot make them grow without bound.
+CACHE_SIZE = 4096
+
+_label_keys = dict()
+_dates = dict()
+
+
+def wordize(text):
+    """
+    Replace characters not matching the regex "[a-z0-9_+]+" with
+    underscores and remove any trailing and leading underscores.
+    """
+    return EDGE_UNDERSCORE_REGEX.sub('', NON_WORD_REGEX.sub('_', text.lower()))
+
+
+def label_key(label):
+    """
+    Memoized wordize for the labels in the left column of table rows.
+    """
+    try:
+        return _label_keys[label]
+    except KeyError:
+        pass
+    if len(_label_keys) >= CACHE_SIZE:
+        _label_keys.clear()
+    key = _label_keys[label] = wordize(label)
+    return key
+
+
+def cell_text(cell):
+    """
+    Return the text of a table cell whose contents are all strings with
+    leading and trailing whitespace removed.
+    """
+    contents = cell.contents
+    if len(contents) == 1:
+        return contents[0].strip()
+    return ' '.join(contents).strip()
+
+
+def parse_amount(text):
+    """
+    Convert a dollar amount like "-$1,234.56" into a Decimal.
+    """
+    digits = text.replace('$', '').replace(',', '')
+    try:
+        return decimal.Decimal(digits)
+    except decimal.InvalidOperation:
+        return decimal.Decimal(NON_AMOUNT_REGEX.sub('', text))
+
+
+def parse_date(text):
+    """
+    Convert a date formatted as "MM/DD/YYYY" into a datetime.datetime. A
+    ValueError is raised if the text is not a date in that format. Results are
+    memoized, and since datetime instances are immutable, transactions from
+    the same day share one instance.
+    """
+    try:
+        return _dates[text]
+    except KeyError:
+        pass
+
+    try:
+        month, day, year = text.split('/')
+        date = datetime.datetime(int(year), int(month), int(day))
+    except (TypeError, ValueError):
+        raise ValueError('Expected a date formatted as MM/DD/YYYY: %r' % text)
+
+    if len(_dates) >= CACHE_SIZE:
+        _dates.clear()
+    _dates[text] = date
+    return date
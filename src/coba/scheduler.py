@@ -0,0 +1,203 @@
+#!/usr/bin/env python
+"""
+Rate limiting of the requests made by agents. Chase Online logs out sessions
+that make requests too quickly, and every request after that has to log in
+again, so agents sharing a Scheduler wait for their turn before each request
+instead.
+"""
+__author__ = "Eric Pruitt <eric.pruitt@gmail.com>"
+__license__ = "2-Clause BSD"
+
+import heapq
+import itertools
+import threading
+import time
+import urlparse
+
+import mechanize
+
+__all__ = ["Scheduler", "INTERACTIVE", "BACKGROUND", "host_of"]
+
+# Priorities of requests; requests with lower values are sent first.
+INTERACTIVE = 0
+BACKGROUND = 1
+
+
+def host_of(url):
+    """
+    Return the host and port of a URL as used to key rate limits.
+    """
+    return urlparse.urlparse(url).netloc.lower()
+
+
+class _Bucket(object):
+    """
+    Token bucket and queue of waiting requests for a single host.
+    """
+    __slots__ = ('rate', 'maximum', 'burst', 'tokens', 'updated', 'ceiling',
+        'ceiling_expires', 'waiters')
+
+    def __init__(self, rate, burst):
+        self.rate = rate
+        self.maximum = rate
+        self.burst = burst
+        self.tokens = burst
+        self.updated = time.time()
+        self.ceiling = None
+        self.ceiling_expires = 0
+        self.waiters = list()
+
+    def refill(self, now):
+        self.tokens = min(self.burst,
+            self.tokens + (now - self.updated) * self.rate)
+        self.updated = now
+
+
+class Scheduler(object):
+    """
+    Shared by every agent that should be rate limited together. Each host
+    gets a token bucket that allows `burst` requests at once and `rate`
+    requests per second after that unless configured otherwise with `limit`.
+    Waiting requests are sent in order of priority, then in the order they
+    were made, so INTERACTIVE requests are not held up by BACKGROUND ones.
+
+    When an agent finds an error page, the host's rate is multiplied by
+    `backoff`, but never made lower than `min_rate`, and the rate it failed at
+    is remembered for `probe_interval` seconds. Each successful page view
+    raises the rate by `recovery` requests per second up to 90% of that
+    rate, so the scheduler settles just below the rate the server tolerates
+    instead of repeatedly running into it. Once `probe_interval` seconds pass
+    without errors, the rate is allowed to climb back to its maximum.
+    """
+    def __init__(self, rate=2.0, burst=4, min_rate=0.1, backoff=0.5,
+      recovery=0.05, probe_interval=300):
+        self.rate = rate
+        self.burst = burst
+        self.min_rate = min_rate
+        self.backoff = backoff
+        self.recovery = recovery
+        self.probe_interval = probe_interval
+        self._buckets = dict()
+        self._sequence = itertools.count()
+        self._condition = threading.Condition()
+
+    def _bucket(self, host):
+        try:
+            return self._buckets[host]
+        except KeyError:
+            bucket = self._buckets[host] = _Bucket(self.rate, self.burst)
+            return bucket
+
+    def limit(self, host, rate, burst=None):
+        """
+        Set the maximum rate in requests per second and the burst size of
+        requests to `host`, the host and port as returned by `host_of`.
+        """
+        with self._condition:
+            bucket = self._bucket(host)
+            bucket.refill(time.time())
+            bucket.rate = bucket.maximum = rate
+            bucket.ceiling = None
+            if burst is not None:
+                bucket.burst = burst
+            self._condition.notify_all()
+
+    def current_rate(self, host):
+        """
+        Return the rate requests to `host` are currently limited to.
+        """
+        with self._condition:
+            return self._bucket(host).rate
+
+    def acquire(self, host, priority=INTERACTIVE):
+        """
+        Wait until a request can be sent to `host` and return the number of
+        seconds spent waiting.
+        """
+        start = time.time()
+        with self._condition:
+            bucket = self._bucket(host)
+            entry = (priority, next(self._sequence))
+            heapq.heappush(bucket.waiters, entry)
+            try:
+                while True:
+                    now = time.time()
+                    bucket.refill(now)
+                    if bucket.waiters[0] != entry:
+                        timeout = None
+                    elif bucket.tokens >= 1:
+                        break
+                    else:
+                        timeout = (1 - bucket.tokens) / bucket.rate
+                    self._condition.wait(timeout)
+            except BaseException:
+                bucket.waiters.remove(entry)
+                heapq.heapify(bucket.waiters)
+                self._condition.notify_all()
+                raise
+
+            heapq.heappop(bucket.waiters)
+            bucket.tokens -= 1
+            self._condition.notify_all()
+
+        return time.time() - start
+
+    def success(self, host):
+        """
+        Report that a page from `host` was loaded without errors.
+        """
+        with self._condition:
+            bucket = self._bucket(host)
+            now = time.time()
+            if bucket.ceiling is not None and now >= bucket.ceiling_expires:
+                bucket.ceiling = None
+
+            target = bucket.maximum
+            if bucket.ceiling is not None:
+                target = min(target, bucket.ceiling * 0.9)
+            if bucket.rate < target:
+                bucket.refill(now)
+                bucket.rate = min(target, bucket.rate + self.recovery)
+                self._condition.notify_all()
+
+    def failure(self, host):
+        """
+        Report that `host` returned an error page, slowing requests down.
+        """
+        with self._condition:
+            bucket = self._bucket(host)
+            now = time.time()
+            bucket.refill(now)
+            bucket.ceiling = bucket.rate
+            bucket.ceiling_expires = now + self.probe_interval
+            bucket.rate = max(self.min_rate, bucket.rate * self.backoff)
+            # Requests that were already allowed through are not taken back,
+            # but no more are sent until the slower rate has earned a token.
+            bucket.tokens = min(bucket.tokens, 0)
+
+    def handler(self, agent):
+        """
+        Return a mechanize handler that makes every request of `agent`,
+        including redirections and form submissions, wait for its turn.
+        """
+        return _SchedulingHandler(self, agent)
+
+
+class _SchedulingHandler(mechanize.BaseHandler):
+    # Preprocessors run in ascending order; waiting happens right before the
+    # request is opened.
+    handler_order = 950
+
+    def __init__(self, scheduler, agent):
+        self.scheduler = scheduler
+        self.agent = agent
+
+    def http_request(self, request):
+        waited = self.scheduler.acquire(host_of(request.get_full_url()),
+            self.agent.priority)
+        recorder = self.agent.instrumentation
+        if recorder is not None:
+            recorder.observe('schedule', waited)
+        return request
+
+    https_request = http_request
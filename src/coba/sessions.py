@@ -0,0 +1,157 @@
+#!/usr/bin/env python
+"""
+Pool of Chase Online Banking agents for applications that serve many
+customers from a single process.
+"""
+__author__ = "Eric Pruitt <eric.pruitt@gmail.com>"
+__license__ = "2-Clause BSD"
+
+import collections
+import threading
+
+import coba
+
+__all__ = ["SessionPool"]
+
+
+class SessionPool(object):
+    """
+    Keeps at most `maxsize` agents alive. Agents are only created when a
+    customer's session is first requested, and when the pool is full, the
+    least recently used agent is evicted and closed, which stops refreshing
+    its session and writes its cookies to its "cookiefile" so the session can
+    be resumed without logging in again the next time it is requested.
+    Customers registered without a "cookiefile" will have to log in again
+    after being evicted.
+
+    The `hits`, `misses` and `evictions` attributes count requests for agents
+    that were in the pool, requests that required creating an agent and agents
+    that were evicted respectively.
+    """
+    def __init__(self, maxsize=100, factory=coba.ChaseOnlineBankingAgent):
+        self.maxsize = maxsize
+        self.factory = factory
+        self.hits = 0
+        self.misses = 0
+        self.evictions = 0
+        self._configurations = dict()
+        self._agents = collections.OrderedDict()
+        self._lock = threading.Lock()
+        # Events set once the agent being created for a key is in the pool or
+        # its creation failed.
+        self._creating = dict()
+
+    def __len__(self):
+        return len(self._agents)
+
+    def __contains__(self, key):
+        return key in self._agents
+
+    def register(self, key, **kwargs):
+        """
+        Associate `key` with the arguments used to create its agent. The
+        keyword arguments are the same as those of ChaseOnlineBankingAgent. If
+        an agent for the key is already in the pool, it is evicted so the new
+        arguments take effect.
+        """
+        self.evict(key)
+        with self._lock:
+            self._configurations[key] = kwargs
+
+    def unregister(self, key):
+        """
+        Evict the agent for `key` and forget its arguments.
+        """
+        self.evict(key)
+        with self._lock:
+            self._configurations.pop(key, None)
+
+    def get(self, key):
+        """
+        Return the agent for `key` creating it if necessary. A KeyError is
+        raised if the key was never registered. When several threads request
+        an agent that is not in the pool at the same time, only one of them
+        creates it, which may involve logging in, and the others wait for it.
+        """
+        while True:
+            with self._lock:
+                agent = self._agents.pop(key, None)
+                if agent is not None:
+                    self._agents[key] = agent
+                    self.hits += 1
+                    return agent
+
+                creation = self._creating.get(key)
+                if creation is None:
+                    self.misses += 1
+                    kwargs = self._configurations[key]
+                    creation = self._creating[key] = threading.Event()
+                    break
+
+            # If creating the agent fails, the next thread in line tries.
+            creation.wait()
+
+        # Creating an agent requires network requests, so it is done without
+        # holding the lock.
+        try:
+            agent = self.factory(**kwargs)
+        except BaseException:
+            with self._lock:
+                del self._creating[key]
+            creation.set()
+            raise
+
+        with self._lock:
+            self._agents[key] = agent
+            del self._creating[key]
+            evicted = list()
+            while len(self._agents) > self.maxsize:
+                evicted.append(self._agents.popitem(last=False)[1])
+            self.evictions += len(evicted)
+        creation.set()
+
+        for idle_agent in evicted:
+            idle_agent.close()
+
+        return agent
+
+    def evict(self, key):
+        """
+        Remove the agent for `key` from the pool and close it, saving its
+        cookies.
+        Returns True if there was an agent to evict.
+        """
+        with self._lock:
+            agent = self._agents.pop(key, None)
+            if agent is None:
+                return False
+            self.evictions += 1
+
+        agent.close()
+        return True
+
+    def clear(self):
+        """
+        Evict every agent.
+        """
+        with self._lock:
+            agents, self._agents = self._agents, collections.OrderedDict()
+            self.evictions += len(agents)
+
+        for agent in agents.values():
+            agent.close()
+
+    def stats(self):
+        """
+        Return a dictionary with the pool's size and hit, miss and eviction
+        counts along with the hit ratio.
+        """
+        requests = self.hits + self.misses
+        return {
+            'size': len(self._agents),
+            'maxsize': self.maxsize,
+            'hits': self.hits,
+            'misses': self.misses,
+            'evictions': self.evictions,
+            'hit_ratio': float(self.hits) / requests if requests else 0.0,
+        }
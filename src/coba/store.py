@@ -0,0 +1,221 @@
+#!/usr/bin/env python
+"""
+Local SQLite storage for transactions so accounts can be synchronized
+incrementally instead of re-scraping their entire history.
+"""
+__author__ = "Eric Pruitt <eric.pruitt@gmail.com>"
+__license__ = "2-Clause BSD"
+
+import collections
+import datetime
+import decimal
+import hashlib
+import sqlite3
+
+import coba
+
+__all__ = ["TransactionStore", "StoredAccount"]
+
+# Schema changes applied in order to bring a database up to date. The number of
+# changes already applied is tracked with SQLite's "user_version" pragma.
+MIGRATIONS = ["""
+CREATE TABLE IF NOT EXISTS accounts (
+    id TEXT PRIMARY KEY,
+    name TEXT NOT NULL,
+    kind TEXT NOT NULL,
+    synced TEXT
+);
+CREATE TABLE IF NOT EXISTS transactions (
+    account_id TEXT NOT NULL REFERENCES accounts (id),
+    identity TEXT NOT NULL,
+    date TEXT NOT NULL,
+    name TEXT NOT NULL,
+    amount TEXT,
+    balance TEXT,
+    type TEXT,
+    id TEXT,
+    memo TEXT,
+    PRIMARY KEY (account_id, identity)
+);
+""", """
+ALTER TABLE accounts ADD COLUMN rewards_program TEXT;
+ALTER TABLE transactions ADD COLUMN cents INTEGER;
+UPDATE transactions SET cents = CAST(ROUND(amount * 100) AS INTEGER);
+CREATE INDEX transactions_date ON transactions (date);
+CREATE INDEX transactions_cents ON transactions (cents);
+CREATE INDEX transactions_name ON transactions (name COLLATE NOCASE);
+"""]
+
+# Transaction fields that map directly onto columns of the transactions table.
+COLUMNS = ('name', 'amount', 'balance', 'type', 'id', 'memo')
+
+# Account information kept in the store so it can be searched without
+# fetching the list of accounts.
+StoredAccount = collections.namedtuple('StoredAccount',
+    'id_ name kind rewards_program')
+
+
+class TransactionStore(object):
+    """
+    SQLite database of posted transactions keyed by the account's `id_` and a
+    digest of each transaction. Pending transactions are never stored since
+    their details change once they post.
+    """
+    def __init__(self, path):
+        self.path = path
+        self.connection = sqlite3.connect(path)
+
+        version = self.connection.execute("PRAGMA user_version").fetchone()[0]
+        for script in MIGRATIONS[version:]:
+            version += 1
+            self.connection.executescript(
+                script + "PRAGMA user_version = %d;" % version)
+
+    def close(self):
+        """
+        Close the underlying database connection.
+        """
+        self.connection.close()
+
+    def high_water_mark(self, account_id):
+        """
+        Return the date of the most recent transaction stored for the account
+        or None if there are no transactions stored for it.
+        """
+        row = self.connection.execute(
+            "SELECT MAX(date) FROM transactions WHERE account_id = ?",
+            (account_id, )).fetchone()
+        if row[0] is None:
+            return None
+        return datetime.datetime.strptime(row[0], '%Y-%m-%d')
+
+    def add(self, account, transactions):
+        """
+        Store posted transactions belonging to `account` and return the number
+        of transactions that were not already in the store.
+        """
+        # Transactions that are identical in every way, e.g. two purchases of
+        # the same amount at the same store on the same day, are told apart by
+        # the order in which they appear.
+        seen = collections.Counter()
+        added = 0
+        with self.connection:
+            self.connection.execute(
+                "INSERT OR REPLACE INTO accounts VALUES (?, ?, ?, ?, ?)",
+                (account.id_, account.name, account.transaction_class.__name__,
+                datetime.datetime.now().isoformat(),
+                getattr(account, 'rewards_program', None)))
+
+            for transaction in transactions:
+                if not transaction.date:
+                    continue
+
+                fields = tuple(transaction)
+                seen[fields] += 1
+                identity = hashlib.sha1(repr((fields, seen[fields]))).hexdigest()
+
+                values = [account.id_, identity,
+                    transaction.date.strftime('%Y-%m-%d')]
+                for column in COLUMNS:
+                    value = getattr(transaction, column, None)
+                    values.append(None if value is None else unicode(value))
+                values.append(_cents(transaction.amount))
+
+                cursor = self.connection.execute(
+                    "INSERT OR IGNORE INTO transactions VALUES "
+                    "(?, ?, ?, ?, ?, ?, ?, ?, ?, ?)", values)
+                added += cursor.rowcount
+
+        return added
+
+    def accounts(self):
+        """
+        Return StoredAccount instances for every account that has been
+        synchronized at least once.
+        """
+        return [StoredAccount(*row) for row in self.connection.execute(
+            "SELECT id, name, kind, rewards_program FROM accounts "
+            "ORDER BY rowid")]
+
+    def transactions(self, account, since=None, through=None):
+        """
+        Yield the stored transactions of `account` from newest to oldest as
+        instances of the account's transaction class. The `since` and
+        `through` arguments behave like their ChaseBankAccount.transactions
+        counterparts.
+        """
+        query = ("SELECT transactions.*, accounts.kind FROM transactions "
+            "JOIN accounts ON accounts.id = account_id WHERE account_id = ?")
+        parameters = [account.id_]
+        if since:
+            query += " AND date >= ?"
+            parameters.append(since.strftime('%Y-%m-%d'))
+        if through:
+            query += " AND date <= ?"
+            parameters.append(through.strftime('%Y-%m-%d'))
+        query += " ORDER BY date DESC, transactions.rowid"
+
+        for row in self.connection.execute(query, parameters):
+            yield _transaction(row)
+
+    def search(self, accounts=None, since=None, through=None, minimum=None,
+      maximum=None, contains=None):
+        """
+        Yield stored transactions from oldest to newest. The results can be
+        limited to the given accounts, a date range, amounts between `minimum`
+        and `maximum` inclusive and names that contain the text `contains`
+        without regard to case. The date, amount and name columns are indexed,
+        so queries are answered without scanning every transaction.
+        """
+        query = ("SELECT transactions.*, accounts.kind FROM transactions "
+            "JOIN accounts ON accounts.id = account_id WHERE 1")
+        parameters = list()
+        if accounts is not None:
+            ids = [account.id_ for account in accounts]
+            query += " AND account_id IN (%s)" % ', '.join('?' * len(ids))
+            parameters.extend(ids)
+        if since:
+            query += " AND date >= ?"
+            parameters.append(since.strftime('%Y-%m-%d'))
+        if through:
+            query += " AND date <= ?"
+            parameters.append(through.strftime('%Y-%m-%d'))
+        if minimum is not None:
+            query += " AND cents >= ?"
+            parameters.append(_cents(minimum))
+        if maximum is not None:
+            query += " AND cents <= ?"
+            parameters.append(_cents(maximum))
+        if contains:
+            query += " AND transactions.name LIKE ? ESCAPE '\\'"
+            escaped = contains.replace('\\', '\\\\').replace('%', '\\%')
+            parameters.append('%' + escaped.replace('_', '\\_') + '%')
+        query += " ORDER BY date, transactions.rowid"
+
+        for row in self.connection.execute(query, parameters):
+            yield _transaction(row)
+
+
+def _cents(amount):
+    """
+    Convert a monetary amount into an integer number of cents.
+    """
+    if amount is None:
+        return None
+    return int(decimal.Decimal(amount).scaleb(2).to_integral_value())
+
+
+def _transaction(row):
+    """
+    Convert a row of the transactions table followed by the account kind into
+    a transaction instance.
+    """
+    transaction_class = getattr(coba, row[-1])
+    values = dict(zip(COLUMNS, row[3:9]))
+    values['date'] = datetime.datetime.strptime(row[2], '%Y-%m-%d')
+    for key in ('amount', 'balance'):
+        if values[key] is not None:
+            values[key] = decimal.Decimal(values[key])
+
+    return transaction_class(**dict((field, values[field])
+        for field in transaction_class._fields))
@@ -12,12 +12,18 @@ Example::
    ...     ca_certs='cacrt.pem'))
    >>> opener.open('https://example.com/').read()
 """
-__all__ = ['match_hostname', 'CertificateError']
+__all__ = ['match_hostname', 'CertificateError', 'ConnectionPool']
 
 
+import errno
+import hashlib
+import math
 import os
+import select
 import sys
 import socket
+import threading
+import time
 
 # Common certificate paths taken from http://bugs.python.org/issue13655.
 COMMON_CERT_PATHS = [
@@ -45,49 +51,262 @@ if not CA_CERTS:
     else:
         raise Exception('Unable to locate CA certificates.')
 
-if not hasattr(socket, 'create_connection'): # for Python 2.4
-    _GLOBAL_DEFAULT_TIMEOUT = getattr(socket, '_GLOBAL_DEFAULT_TIMEOUT', object())
-    # copy-paste from stdlib's socket.py (py2.6)
-    def create_connection(address, timeout=_GLOBAL_DEFAULT_TIMEOUT,
-                          source_address=None):
-        """Connect to *address* and return the socket object.
-
-        Convenience function.  Connect to *address* (a 2-tuple ``(host,
-        port)``) and return the socket object.  Passing the optional
-        *timeout* parameter will set the timeout on the socket instance
-        before attempting to connect.  If no *timeout* is supplied, the
-        global default timeout setting returned by :func:`getdefaulttimeout`
-        is used.
-        """
-
-        host, port = address
-        err = None
-        for res in socket.getaddrinfo(host, port, 0, socket.SOCK_STREAM):
-            af, socktype, proto, canonname, sa = res
-            sock = None
-            try:
-                sock = socket.socket(af, socktype, proto)
-                if timeout is not _GLOBAL_DEFAULT_TIMEOUT:
-                    sock.settimeout(timeout)
-                if source_address:
-                    sock.bind(source_address)
-                sock.connect(sa)
-                return sock
+_GLOBAL_DEFAULT_TIMEOUT = getattr(socket, '_GLOBAL_DEFAULT_TIMEOUT', object())
+
+# Seconds that resolved addresses are cached for by `create_connection`. When
+# the resolver fails, expired entries are used anyway.
+DNS_CACHE_TTL = 300
+
+# Seconds to wait for a connection attempt before racing the next address
+# returned by the resolver against it. See RFC 8305.
+CONNECTION_ATTEMPT_DELAY = 0.25
+
+_address_cache = {}
+
+# Recorder told about DNS lookups, connections, handshakes and bytes sent and
+# received, or None. See coba.instrument.
+instrumentation = None
+
+_CONNECT_IN_PROGRESS = (errno.EINPROGRESS, errno.EWOULDBLOCK, errno.EALREADY,
+                        getattr(errno, 'WSAEWOULDBLOCK', errno.EWOULDBLOCK))
+
+if hasattr(select, 'poll'):
+    _POLL_READ = select.POLLIN | select.POLLPRI | select.POLLERR | \
+        select.POLLHUP
+    _POLL_WRITE = select.POLLOUT | select.POLLERR | select.POLLHUP
+
+def _wait(sockets, write=False, timeout=None):
+    """Return those of *sockets* that are ready within *timeout* seconds.
+
+    Sockets are waited on until they are writable when *write* is true or
+    readable otherwise, and waiting lasts forever when *timeout* is None.
+    poll() is used where it exists since select() cannot handle file
+    descriptors at or above FD_SETSIZE, which long-running processes holding
+    many connections reach.
+    """
+    if hasattr(select, 'poll'):
+        poller = select.poll()
+        by_fd = {}
+        for sock in sockets:
+            by_fd[sock.fileno()] = sock
+            poller.register(sock, write and _POLL_WRITE or _POLL_READ)
+        if timeout is not None:
+            timeout = max(0, int(math.ceil(timeout * 1000)))
+        return [by_fd[fd] for fd, _ in poller.poll(timeout)]
+
+    try:
+        if write:
+            return select.select([], list(sockets), [], timeout)[1]
+        return select.select(list(sockets), [], [], timeout)[0]
+    except ValueError:
+        # Raised for file descriptors select() cannot handle.
+        raise socket.error(errno.EBADF, str(sys.exc_info()[1]))
+
+def _resolve(host, port):
+    key = (host, port)
+    cached = _address_cache.get(key)
+    recorder = instrumentation
+    if cached and cached[0] > time.time():
+        if recorder is not None:
+            recorder.count('dns.cached')
+        return cached[1]
+    if recorder is not None:
+        start = time.time()
+    try:
+        addresses = socket.getaddrinfo(host, port, 0, socket.SOCK_STREAM)
+    except socket.gaierror:
+        if cached:
+            return cached[1]
+        raise
+    finally:
+        if recorder is not None:
+            recorder.observe('dns', time.time() - start)
+
+    # Alternate address families so a broken IPv6 (or IPv4) route only costs
+    # one attempt delay.
+    families = {}
+    queues = []
+    for res in addresses:
+        if res[0] not in families:
+            families[res[0]] = []
+            queues.append(families[res[0]])
+        families[res[0]].append(res)
+    interleaved = []
+    while queues:
+        for queue in list(queues):
+            interleaved.append(queue.pop(0))
+            if not queue:
+                queues.remove(queue)
+
+    _address_cache[key] = (time.time() + DNS_CACHE_TTL, interleaved)
+    return interleaved
+
+def create_connection(address, timeout=_GLOBAL_DEFAULT_TIMEOUT,
+                      source_address=None):
+    """Connect to *address* and return the socket object.
+
+    Convenience function.  Connect to *address* (a 2-tuple ``(host,
+    port)``) and return the socket object.  Passing the optional
+    *timeout* parameter will set the timeout on the socket instance
+    before attempting to connect.  If no *timeout* is supplied, the
+    global default timeout setting returned by :func:`getdefaulttimeout`
+    is used.
+
+    Unlike the stdlib version, resolved addresses are cached for
+    `DNS_CACHE_TTL` seconds, and when an address does not connect within
+    `CONNECTION_ATTEMPT_DELAY` seconds, the next one is tried in parallel
+    with the first connection to succeed being returned.
+    """
+
+    host, port = address
+    addresses = list(_resolve(host, port))
+    if timeout is _GLOBAL_DEFAULT_TIMEOUT:
+        timeout = socket.getdefaulttimeout()
+    if timeout is not None:
+        deadline = time.time() + timeout
+    err = None
+    pending = {}
+    try:
+        while addresses or pending:
+            if addresses:
+                af, socktype, proto, canonname, sa = addresses.pop(0)
+                sock = None
+                try:
+                    sock = socket.socket(af, socktype, proto)
+                    sock.setblocking(0)
+                    if source_address:
+                        sock.bind(source_address)
+                    code = sock.connect_ex(sa)
+                    if code and code not in _CONNECT_IN_PROGRESS:
+                        raise socket.error(code, os.strerror(code))
+                    pending[sock] = sa
+                except socket.error:
+                    err = sys.exc_info()[1]
+                    if sock is not None:
+                        sock.close()
+                    continue
+
+            if not pending:
+                continue
+
+            wait = None
+            if addresses:
+                wait = CONNECTION_ATTEMPT_DELAY
+            if timeout is not None:
+                left = deadline - time.time()
+                if left <= 0:
+                    err = socket.timeout('timed out')
+                    break
+                if wait is None or left < wait:
+                    wait = left
 
+            try:
+                writable = _wait(pending, write=True, timeout=wait)
             except socket.error:
+                # None of the pending sockets can be waited on, so give up on
+                # them and try the next address.
                 err = sys.exc_info()[1]
-                if sock is not None:
+                for sock in pending:
                     sock.close()
+                pending.clear()
+                continue
 
-        if err is not None:
-            raise err
-        else:
-            raise socket.error("getaddrinfo returns an empty list")
+            for sock in writable:
+                code = sock.getsockopt(socket.SOL_SOCKET, socket.SO_ERROR)
+                del pending[sock]
+                if not code:
+                    sock.settimeout(timeout)
+                    return sock
+                err = socket.error(code, os.strerror(code))
+                sock.close()
+
+    finally:
+        for sock in pending:
+            sock.close()
+
+    # Whatever the resolver returned did not work, so do not keep using it.
+    _address_cache.pop((host, port), None)
+    if err is not None:
+        raise err
+    else:
+        raise socket.error("getaddrinfo returns an empty list")
 
+if not hasattr(socket, 'create_connection'): # for Python 2.4
     # monkey-patch socket module
     socket.create_connection = create_connection
 
 
+class ConnectionPool(object):
+    """Idle keep-alive sockets shared by every `HTTPSConnection`.
+
+    Sockets are keyed by host and port. At most *maxsize* idle sockets are
+    kept per host, and sockets that have been idle for longer than
+    *idle_timeout* seconds are discarded instead of being reused so they are
+    not handed out after the server has given up on them.
+    """
+    def __init__(self, maxsize=4, idle_timeout=60):
+        self.maxsize = maxsize
+        self.idle_timeout = idle_timeout
+        self.lock = threading.Lock()
+        self.idle = {}
+
+    def get(self, key):
+        """Return an idle socket connected to *key* or None."""
+        now = time.time()
+        while True:
+            self.lock.acquire()
+            try:
+                sockets = self.idle.get(key)
+                if not sockets:
+                    return None
+                sock, released = sockets.pop()
+            finally:
+                self.lock.release()
+
+            if now - released < self.idle_timeout and self._usable(sock):
+                return sock
+            sock.close()
+
+    def put(self, key, sock):
+        """Return *sock* to the pool once its last response was read."""
+        self.lock.acquire()
+        try:
+            sockets = self.idle.setdefault(key, [])
+            if len(sockets) < self.maxsize:
+                sockets.append((sock, time.time()))
+                return
+        finally:
+            self.lock.release()
+        sock.close()
+
+    def clear(self):
+        """Close every idle socket."""
+        self.lock.acquire()
+        try:
+            idle, self.idle = self.idle, {}
+        finally:
+            self.lock.release()
+        for sockets in idle.values():
+            for sock, _ in sockets:
+                sock.close()
+
+    @staticmethod
+    def _usable(sock):
+        # An idle socket should have nothing to read. If it is readable, the
+        # server either closed the connection or sent data we did not ask for.
+        if getattr(sock, 'pending', None) and sock.pending():
+            return False
+        try:
+            return not _wait([sock], timeout=0)
+        except (select.error, socket.error):
+            return False
+
+
+# Pool used by `HTTPSConnection` unless another one is passed in. Its
+# "maxsize" and "idle_timeout" attributes can be adjusted at any time.
+connection_pool = ConnectionPool()
+
+
 # copy-paste from stdlib's ssl.py (py3.2)
 class CertificateError(ValueError):
     pass
@@ -135,7 +354,14 @@ def match_hostname(cert, hostname):
         raise CertificateError("no appropriate commonName or "
             "subjectAltName fields were found")
 
+# Compiled patterns keyed by the DNS name they were built from.
+_dnsname_pats = {}
+
 def _dnsname_to_pat(dn):
+    try:
+        return _dnsname_pats[dn]
+    except KeyError:
+        pass
     pats = []
     for frag in dn.split(r'.'):
         if frag == '*':
@@ -146,7 +372,11 @@ def _dnsname_to_pat(dn):
             # Otherwise, '*' matches any dotless fragment.
             frag = re.escape(frag)
             pats.append(frag.replace(r'\*', '[^.]*'))
-    return re.compile(r'\A' + r'\.'.join(pats) + r'\Z', re.IGNORECASE)
+    pat = re.compile(r'\A' + r'\.'.join(pats) + r'\Z', re.IGNORECASE)
+    if len(_dnsname_pats) >= 256:
+        _dnsname_pats.clear()
+    _dnsname_pats[dn] = pat
+    return pat
 
 
 try: import ssl
@@ -177,46 +407,239 @@ else: # ssl is available
 
     original_httpsconnection = client.HTTPSConnection
 
+    # SSLContext objects keyed by their settings. Creating a context means
+    # parsing the entire CA bundle, so it is only done once per combination.
+    _contexts = {}
+
+    # The last TLS session negotiated with each host and port which is offered
+    # to the server when reconnecting so it can skip the full handshake. Only
+    # Python 3.6+ exposes sessions.
+    _sessions = {}
+    SESSION_REUSE = hasattr(ssl, 'SSLSession')
+
+    # (certificate fingerprint, hostname, checker) tuples that have already
+    # passed the hostname check.
+    _verified_hosts = set()
+
+    def get_context(ca_certs=None, key_file=None, cert_file=None):
+        """Return a shared SSLContext or None when SSLContext is missing."""
+        if not hasattr(ssl, 'SSLContext'):
+            return None # Python < 2.7.9
+        key = (ca_certs, key_file, cert_file)
+        try:
+            return _contexts[key]
+        except KeyError:
+            pass
+        context = ssl.SSLContext(ssl.PROTOCOL_SSLv23)
+        # Hostnames are checked by HTTPSConnection.checker.
+        context.check_hostname = False
+        if ca_certs is not None:
+            context.verify_mode = ssl.CERT_REQUIRED
+            context.load_verify_locations(ca_certs)
+        if cert_file:
+            context.load_cert_chain(cert_file, key_file)
+        _contexts[key] = context
+        return context
+
+    # Methods that can safely be sent again when a pooled socket turns out to
+    # have been closed by the server.
+    IDEMPOTENT_METHODS = ('GET', 'HEAD', 'OPTIONS')
+
+    # Errors raised when using a pooled socket the server has closed. Others,
+    # timeouts in particular, are not retried since the server was reached.
+    STALE_SOCKET_ERRNOS = (errno.EPIPE, errno.ECONNRESET)
+
+    class PooledHTTPResponse(client.HTTPResponse):
+        # HTTPResponse closes itself once the entire body has been read, so
+        # that is the point where the socket can be used for another request.
+        release = None
+
+        def read(self, *args, **kwargs):
+            data = client.HTTPResponse.read(self, *args, **kwargs)
+            if instrumentation is not None:
+                instrumentation.count('response_bytes', len(data))
+            if self.fp is None and self.release is not None:
+                release, self.release = self.release, None
+                release()
+            return data
+
     class HTTPSConnection(original_httpsconnection):
+        response_class = PooledHTTPResponse
+
         def __init__(self, host, **kwargs):         
             self.ca_certs = kwargs.pop('ca_certs', None) or CA_CERTS
             self.checker = kwargs.pop('checker', match_hostname)
+            self.pool = kwargs.pop('pool', connection_pool)
+            self.reused = False
+            self._skip_pool = False
+            self._request_args = None
 
             # for python < 2.6
             self.timeout = kwargs.get('timeout', socket.getdefaulttimeout())
 
-            original_httpsconnection.__init__(self, host, **kwargs)
+            # Without a context, Python 2.7.9+ creates a new default one for
+            # every connection, reloading the system's CA certificates each
+            # time even though connect uses the shared context instead.
+            # The client certificate is withheld from the base class since it
+            # would load it into the shared context again.
+            context = get_context(self.ca_certs, kwargs.get('key_file'),
+                                  kwargs.get('cert_file'))
+            if context is None or 'context' in kwargs:
+                original_httpsconnection.__init__(self, host, **kwargs)
+            else:
+                key_file = kwargs.pop('key_file', None)
+                cert_file = kwargs.pop('cert_file', None)
+                original_httpsconnection.__init__(self, host, context=context,
+                                                  **kwargs)
+                self.key_file = key_file
+                self.cert_file = cert_file
+
+        def _pool_key(self):
+            return (self.host, self.port, getattr(self, '_tunnel_host', None))
+
+        def putheader(self, header, *values):
+            # urllib2 and mechanize force "Connection: close" because their
+            # response objects cannot deal with persistent connections. The
+            # pooled response takes care of that, so leave HTTP/1.1's default
+            # keep-alive behaviour in place.
+            if (self.pool is not None and header.lower() == 'connection' and
+              values == ('close',)):
+                return
+            original_httpsconnection.putheader(self, header, *values)
+
+        def send(self, data):
+            if instrumentation is not None:
+                instrumentation.count('request_bytes', len(data))
+            original_httpsconnection.send(self, data)
+
+        def request(self, method, url, body=None, headers={}):
+            self._request_args = (method, url, body, headers)
+            try:
+                original_httpsconnection.request(self, method, url, body,
+                                                 headers)
+            except socket.timeout:
+                raise
+            except socket.error:
+                if not self._can_retry(sys.exc_info()[1]):
+                    raise
+                self._retry()
 
+        def getresponse(self, *args, **kwargs):
+            try:
+                response = original_httpsconnection.getresponse(
+                    self, *args, **kwargs)
+            except socket.timeout:
+                # Retrying would make callers wait twice the timeout for a
+                # slow server.
+                raise
+            except (client.BadStatusLine, socket.error):
+                if not self._can_retry(sys.exc_info()[1]):
+                    raise
+                self._retry()
+                response = original_httpsconnection.getresponse(
+                    self, *args, **kwargs)
+
+            # Buffered responses may read past the end of the body, so their
+            # sockets cannot be reused.
+            if (self.pool is not None and not response.will_close and
+              not kwargs.get('buffering') and not args):
+                sock, key, pool = self.sock, self._pool_key(), self.pool
+                # Detach the socket so closing this connection object does
+                # not close a socket that has been returned to the pool.
+                self.sock = None
+                response.release = lambda: pool.put(key, sock)
+            return response
+
+        def _can_retry(self, exc):
+            if (not isinstance(exc, client.BadStatusLine) and
+              getattr(exc, 'errno', None) not in STALE_SOCKET_ERRNOS):
+                return False
+            return (self.reused and self._request_args is not None and
+                    self._request_args[0].upper() in IDEMPOTENT_METHODS)
+
+        def _retry(self):
+            # The pooled socket went stale; send the request again over a
+            # fresh connection.
+            self.close()
+            self._skip_pool = True
+            self.reused = False
+            original_httpsconnection.request(self, *self._request_args)
 
         def connect(self):
+            if self.pool is not None and not self._skip_pool:
+                sock = self.pool.get(self._pool_key())
+                if sock is not None:
+                    if self.timeout is not socket._GLOBAL_DEFAULT_TIMEOUT:
+                        sock.settimeout(self.timeout)
+                    self.sock = sock
+                    self.reused = True
+                    if instrumentation is not None:
+                        instrumentation.count('connection.reused')
+                    return
+
+            # Looked up once so the connection and the handshake are reported
+            # to the same recorder.
+            recorder = instrumentation
+
             # overrides the version in httplib so that we do
             #    certificate verification
             args = [(self.host, self.port), self.timeout,]
             if hasattr(self, 'source_address'):
                 args.append(self.source_address)
-            sock = socket.create_connection(*args)
+            if recorder is not None:
+                start = time.time()
+            sock = create_connection(*args)
 
             if getattr(self, '_tunnel_host', None):
                 self.sock = sock
                 self._tunnel()
+            if recorder is not None:
+                handshake_start = time.time()
+                recorder.observe('connect', handshake_start - start)
             # wrap the socket using verification with the root
             #    certs in self.ca_certs
-            kwargs = {}
-            if self.ca_certs is not None:
-                kwargs.update(
-                    cert_reqs=ssl.CERT_REQUIRED,
-                    ca_certs=self.ca_certs)
-            self.sock = ssl.wrap_socket(sock,
-                                        keyfile=self.key_file,
-                                        certfile=self.cert_file,
-                                        **kwargs)
+            context = get_context(self.ca_certs, self.key_file, self.cert_file)
+            if context is None:
+                kwargs = {}
+                if self.ca_certs is not None:
+                    kwargs.update(
+                        cert_reqs=ssl.CERT_REQUIRED,
+                        ca_certs=self.ca_certs)
+                self.sock = ssl.wrap_socket(sock,
+                                            keyfile=self.key_file,
+                                            certfile=self.cert_file,
+                                            **kwargs)
+            else:
+                kwargs = {}
+                if getattr(ssl, 'HAS_SNI', False):
+                    kwargs['server_hostname'] = self.host
+                session_key = (self.host, self.port)
+                if SESSION_REUSE and session_key in _sessions:
+                    kwargs['session'] = _sessions[session_key]
+                self.sock = context.wrap_socket(sock, **kwargs)
+                if SESSION_REUSE and self.sock.session is not None:
+                    _sessions[session_key] = self.sock.session
             if self.checker is not None:
                 try:
-                    self.checker(self.sock.getpeercert(), self.host)
+                    self.check_hostname()
                 except CertificateError:
                     self.sock.shutdown(socket.SHUT_RDWR)
                     self.sock.close()
                     raise
+            if recorder is not None:
+                recorder.observe('handshake', time.time() - handshake_start)
+
+        def check_hostname(self):
+            # Certificates are identified by their fingerprint so the checker
+            # only runs once per certificate and hostname.
+            der = self.sock.getpeercert(True)
+            key = (hashlib.sha256(der).digest(), self.host, self.checker)
+            if key in _verified_hosts:
+                return
+            self.checker(self.sock.getpeercert(), self.host)
+            if len(_verified_hosts) >= 256:
+                _verified_hosts.clear()
+            _verified_hosts.add(key)
 
     # Monkey-patch httplib
     client.HTTPSConnection = HTTPSConnection
@@ -230,13 +653,14 @@ else: # ssl is available
         #   we use properties passed in rather than static module
         #   fields.
         def __init__(self, key_file=None, cert_file=None, ca_certs=None,
-                     checker=match_hostname):
+                     checker=match_hostname, pool=connection_pool):
             request.HTTPSHandler.__init__(self)
             # see http://docs.python.org/library/ssl.html#certificates
             self.key_file = key_file
             self.cert_file = cert_file
             self.ca_certs = ca_certs
             self.checker = checker
+            self.pool = pool
 
         def https_open(self, req):
             # Rather than pass in a reference to a connection class, we pass in
@@ -248,7 +672,8 @@ else: # ssl is available
             d = dict(cert_file=self.cert_file,
                      key_file=self.key_file,
                      ca_certs=self.ca_certs,
-                     checker=self.checker)
+                     checker=self.checker,
+                     pool=self.pool)
             d.update(kwargs)
             return HTTPSConnection(host, **d)
     __all__.append('HTTPSHandler')
@@ -22,7 +22,8 @@ distutils.core.setup(
     install_requires=[
         'beautifulsoup4',
         'zope.testbrowser >=4.0, <5.0',
-        'mechanize >= 0.2, < 0.3'
+        'mechanize >= 0.2, < 0.3',
+        'futures',
     ],
     scripts=['cobcli'],
 )
@@ -0,0 +1,152 @@
+#!/usr/bin/env python
+"""
+Checks that the date parser of cobcli agrees with GNU date(1), which it
+replaced, on the examples given in the README and in cobcli's help.
+
+GNU date has no option to set the date relative dates are computed from, so
+both are given the current date. cobcli resolves relative dates in US Eastern
+time, which is checked against GNU date with TZ set to America/New_York.
+
+Usage: python -m unittest discover tests
+"""
+import datetime
+import imp
+import os
+import subprocess
+import time
+import unittest
+
+COBCLI = os.path.join(os.path.dirname(__file__), '..', 'src', 'cobcli')
+
+# Pairs of examples and the same date spelled in a way GNU date accepts.
+# Ordinal suffixes and numbers written as words are only understood by
+# cobcli.
+EXAMPLES = [
+    # Calendar dates
+    ('2010-01-01', '2010-01-01'),
+    ('2013-04-25', '2013-04-25'),
+    ('2013-05-01', '2013-05-01'),
+    ('2014-01-01', '2014-01-01'),
+    ('2014-01-07', '2014-01-07'),
+    ('4/25/2013', '4/25/2013'),
+    ('April 25th, 2013', 'April 25, 2013'),
+    ('May 1st, 2013', 'May 1, 2013'),
+    # Days relative to today
+    ('', ''),
+    ('today', 'today'),
+    ('yesterday', 'yesterday'),
+    ('tomorrow', 'tomorrow'),
+    # Weekdays
+    ('monday', 'monday'),
+    ('friday', 'friday'),
+    ('last friday', 'last friday'),
+    ('next monday', 'next monday'),
+    # Relative dates
+    ('one week ago', '1 week ago'),
+    ('two weeks ago', '2 weeks ago'),
+    ('last month', 'last month'),
+    ('next year', 'next year'),
+    ('3 days ago', '3 days ago'),
+    ('+3 days', '+3 days'),
+    ('-3 days', '-3 days'),
+]
+
+# UTC times around midnight in US Eastern time and the changes to and from
+# daylight saving time.
+UTC_TIMES = [
+    datetime.datetime(2013, 1, 1, 4, 59),
+    datetime.datetime(2013, 1, 1, 5, 0),
+    datetime.datetime(2013, 3, 10, 4, 59),
+    datetime.datetime(2013, 3, 10, 5, 0),
+    datetime.datetime(2013, 3, 10, 6, 59),
+    datetime.datetime(2013, 3, 10, 7, 0),
+    datetime.datetime(2013, 7, 1, 3, 59),
+    datetime.datetime(2013, 7, 1, 4, 0),
+    datetime.datetime(2013, 11, 3, 3, 59),
+    datetime.datetime(2013, 11, 3, 4, 0),
+    datetime.datetime(2013, 11, 3, 5, 59),
+    datetime.datetime(2013, 11, 3, 6, 0),
+    datetime.datetime(2013, 11, 4, 4, 59),
+    datetime.datetime(2013, 11, 4, 5, 0),
+    datetime.datetime(2014, 12, 31, 23, 59),
+]
+
+# Time zones far from US Eastern time in both directions.
+LOCAL_TIME_ZONES = ['Asia/Tokyo', 'Pacific/Kiritimati', 'Pacific/Pago_Pago',
+    'UTC']
+
+
+def gnu_date_available():
+    try:
+        process = subprocess.Popen(['date', '--version'],
+            stdout=subprocess.PIPE, stderr=subprocess.PIPE)
+    except OSError:
+        return False
+    return b'GNU coreutils' in process.communicate()[0]
+
+
+def gnu_date(text, tz=None):
+    """
+    Return the date GNU date(1) gives for the text in the time zone `tz`, or
+    the local time zone if it is None.
+    """
+    env = dict(os.environ)
+    if tz is not None:
+        env['TZ'] = tz
+    output = subprocess.check_output(['date', '--date', text, '+%Y %m %d'],
+        env=env)
+    return datetime.datetime(*map(int, output.split()))
+
+
+@unittest.skipUnless(gnu_date_available(), 'GNU date is not installed')
+class ParseDateTest(unittest.TestCase):
+    @classmethod
+    def setUpClass(cls):
+        cls.cobcli = imp.load_source('cobcli', COBCLI)
+
+    def test_examples_match_gnu_date(self):
+        for text, gnu_text in EXAMPLES:
+            # Both sides are retried should the day change in between.
+            for _ in range(2):
+                today = datetime.date.today()
+                expected = gnu_date(gnu_text)
+                actual = self.cobcli._parse_date(text, today)
+                if datetime.date.today() == today:
+                    break
+            self.assertEqual(actual, expected, text)
+
+    def test_eastern_today_matches_gnu_date(self):
+        epoch = datetime.datetime(1970, 1, 1)
+        for utcnow in UTC_TIMES:
+            seconds = int((utcnow - epoch).total_seconds())
+            expected = gnu_date('@%d' % seconds, 'America/New_York').date()
+            self.assertEqual(self.cobcli.eastern_today(utcnow), expected,
+                utcnow)
+
+    def test_relative_dates_ignore_local_time_zone(self):
+        original = os.environ.get('TZ')
+        try:
+            for tz in LOCAL_TIME_ZONES:
+                os.environ['TZ'] = tz
+                time.tzset()
+                for _ in range(2):
+                    expected = gnu_date('today', 'America/New_York')
+                    actual = self.cobcli.parse_date('today')
+                    if gnu_date('today', 'America/New_York') == expected:
+                        break
+                self.assertEqual(actual, expected, tz)
+        finally:
+            if original is None:
+                os.environ.pop('TZ', None)
+            else:
+                os.environ['TZ'] = original
+            time.tzset()
+
+    def test_invalid_dates(self):
+        for text in ('not a date', '13/45/2013', 'tuesday ago'):
+            self.assertRaises(ValueError, self.cobcli._parse_date, text,
+                datetime.date.today())
+
+
+if __name__ == '__main__':
+    unittest.main()
@@ -0,0 +1,123 @@
+#!/usr/bin/env python
+"""
+Tests of the connection handling of coba.urllib2_ssl.
+
+Usage: python -m unittest discover tests
+"""
+import os
+import socket
+import sys
+import unittest
+
+try:
+    import resource
+except ImportError:
+    resource = None
+
+sys.path.insert(0, os.path.join(os.path.dirname(__file__), '..', 'src'))
+
+from coba import urllib2_ssl
+
+# Largest file descriptor select() accepts on common platforms, plus one.
+FD_SETSIZE = 1024
+
+
+def can_exceed_fd_setsize():
+    if resource is None:
+        return False
+    soft, hard = resource.getrlimit(resource.RLIMIT_NOFILE)
+    if soft == resource.RLIM_INFINITY or soft > FD_SETSIZE + 64:
+        return True
+    if hard != resource.RLIM_INFINITY and hard <= FD_SETSIZE + 64:
+        return False
+    try:
+        resource.setrlimit(resource.RLIMIT_NOFILE, (FD_SETSIZE + 256, hard))
+    except (ValueError, resource.error):
+        return False
+    return True
+
+
+class ConnectionTest(unittest.TestCase):
+    def setUp(self):
+        self.listener = socket.socket()
+        self.listener.bind(('127.0.0.1', 0))
+        self.listener.listen(5)
+        self.address = self.listener.getsockname()
+        self.padding = list()
+
+    def tearDown(self):
+        self.listener.close()
+        for fd in self.padding:
+            os.close(fd)
+
+    def exhaust_low_descriptors(self):
+        """
+        Open file descriptors until new ones are at least FD_SETSIZE.
+        """
+        fd = os.open(os.devnull, os.O_RDONLY)
+        self.padding.append(fd)
+        while fd < FD_SETSIZE:
+            fd = os.dup(fd)
+            self.padding.append(fd)
+
+    def test_create_connection(self):
+        sock = urllib2_ssl.create_connection(self.address, 5)
+        try:
+            self.assertEqual(sock.getpeername(), self.address)
+        finally:
+            sock.close()
+
+    @unittest.skipUnless(can_exceed_fd_setsize(),
+        'file descriptors cannot exceed FD_SETSIZE')
+    def test_create_connection_above_fd_setsize(self):
+        self.exhaust_low_descriptors()
+        sock = urllib2_ssl.create_connection(self.address, 5)
+        try:
+            self.assertTrue(sock.fileno() >= FD_SETSIZE)
+            self.assertEqual(sock.getpeername(), self.address)
+        finally:
+            sock.close()
+
+    def connected_pair(self):
+        client = socket.create_connection(self.address, 5)
+        server, _ = self.listener.accept()
+        return client, server
+
+    def test_pool_returns_idle_socket(self):
+        pool = urllib2_ssl.ConnectionPool()
+        client, server = self.connected_pair()
+        try:
+            pool.put(self.address, client)
+            self.assertTrue(pool.get(self.address) is client)
+            self.assertTrue(pool.get(self.address) is None)
+        finally:
+            client.close()
+            server.close()
+
+    def test_pool_discards_closed_socket(self):
+        pool = urllib2_ssl.ConnectionPool()
+        client, server = self.connected_pair()
+        try:
+            pool.put(self.address, client)
+            server.close()
+            self.assertTrue(pool.get(self.address) is None)
+        finally:
+            client.close()
+
+    @unittest.skipUnless(can_exceed_fd_setsize(),
+        'file descriptors cannot exceed FD_SETSIZE')
+    def test_pool_returns_socket_above_fd_setsize(self):
+        self.exhaust_low_descriptors()
+        pool = urllib2_ssl.ConnectionPool()
+        client, server = self.connected_pair()
+        try:
+            self.assertTrue(client.fileno() >= FD_SETSIZE)
+            pool.put(self.address, client)
+            self.assertTrue(pool.get(self.address) is client)
+        finally:
+            client.close()
+            server.close()
+
+
+if __name__ == '__main__':
+    unittest.main()